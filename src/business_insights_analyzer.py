@@ -5,17 +5,197 @@
 
 import pandas as pd
 import numpy as np
-import json
+import pyarrow as pa
+import pyarrow.compute as pc
+import orjson
+from dataclasses import dataclass
+from functools import cached_property
 from datetime import datetime, timedelta
 import math
+import os
+from data_loader import DataLoader
+from results_io import JSON_OPTIONS, write_files
+
+def _day_numbers(timestamps):
+    """
+    Число дней от эпохи для каждой метки времени
+
+    Метки без времени (NaT) получают NaN, а не обрезанное до int32 значение
+    NaT: такие строки не находят курса и не попадают в группировки по дням
+    """
+    days = timestamps.to_numpy().astype('datetime64[D]')
+    missing = np.isnat(days)
+    if not missing.any():
+        return days.astype(np.int32)
+    return np.where(missing, np.nan, days.astype(np.int64))
+
+def _series_to_dict(series):
+    """Словарь из Series для JSON: индекс и значения переводятся в списки целиком"""
+    return dict(zip(series.index.tolist(), series.to_numpy().tolist()))
+
+@dataclass(slots=True, frozen=True)
+class BusinessGrowthMetrics:
+    """Объемы и рост бизнеса"""
+    total_business_volume_usd: float
+    legitimate_business_volume_usd: float
+    business_health_percentage: float
+    daily_average_volume_usd: float
+    daily_average_transactions: float
+    volume_growth_rate_percentage: float
+    transaction_growth_rate_percentage: float
+    peak_daily_volume_usd: float
+    consistent_growth_days: int
+
+@dataclass(slots=True, frozen=True)
+class CustomerInsights:
+    """Клиентская база и лояльность"""
+    total_active_customers: int
+    average_customer_lifetime_value_usd: float
+    median_customer_lifetime_value_usd: float
+    vip_customers_count: int
+    vip_customers_percentage: float
+    vip_revenue_contribution_percentage: float
+    average_transactions_per_customer: float
+    customer_retention_rate: float
+    highly_active_customers: int
+    customer_segments: dict
+
+@dataclass(slots=True, frozen=True)
+class GeographicOpportunities:
+    """Географическая экспансия и возможности"""
+    total_countries_served: int
+    total_cities_served: int
+    top_revenue_countries: list
+    top_markets_revenue_usd: dict
+    emerging_high_value_markets: list
+    average_revenue_per_country_usd: float
+    market_concentration_top5_percentage: float
+    international_expansion_potential: int
+    highest_value_per_customer_country: str
+    highest_value_per_customer_amount: float
+
+@dataclass(slots=True, frozen=True)
+class ProductPerformance:
+    """Продуктовая линейка и категории"""
+    most_profitable_category: str
+    most_profitable_category_revenue_usd: float
+    highest_value_category: str
+    highest_avg_transaction_usd: float
+    category_revenue_distribution: dict
+    most_popular_channel: str
+    channel_revenue_distribution: dict
+    cross_selling_opportunities: int
+    premium_categories_count: int
+
+@dataclass(slots=True, frozen=True)
+class OperationalEfficiency:
+    """Операционная эффективность"""
+    peak_revenue_hours: list
+    peak_transaction_hours: list
+    best_hour_revenue_usd: float
+    weekend_vs_weekday_revenue_ratio: float
+    weekend_premium_percentage: float
+    processing_volume_per_hour_avg: float
+    system_utilization_peak_ratio: float
+    revenue_consistency_score: float
+
+@dataclass(slots=True, frozen=True)
+class InnovationAdoption:
+    """Инновации и технологии"""
+    top_device_by_revenue: str
+    top_device_revenue_usd: float
+    mobile_vs_desktop_ratio: float
+    digital_adoption_percentage: float
+    contactless_vs_contact_ratio: float
+    contactless_revenue_percentage: float
+    device_diversity_score: int
+    innovation_revenue_premium: float
+
+@dataclass(slots=True, frozen=True)
+class CustomerReactivation:
+    """Неиспользованный потенциал клиентов"""
+    low_activity_high_value_customers: int
+    potential_revenue_from_reactivation_usd: float
+    inactive_customers_count: int
+    inactive_customers_lost_revenue_potential_usd: float
+    average_customer_upside_potential_usd: float
+
+@dataclass(slots=True, frozen=True)
+class GeographicExpansion:
+    """Географическая экспансия"""
+    high_potential_markets: list
+    expansion_revenue_potential_usd: float
+    underserved_markets_count: int
+    market_penetration_opportunities: int
+
+@dataclass(slots=True, frozen=True)
+class ProductExpansion:
+    """Продуктовые возможности"""
+    single_category_customers_count: int
+    cross_sell_potential_customers: int
+    average_categories_per_customer: float
+    max_category_utilization_potential: int
+    category_expansion_opportunity_percentage: float
+
+@dataclass(slots=True, frozen=True)
+class BusinessHealth:
+    """Метрики роста и развития бизнеса"""
+    business_growth: BusinessGrowthMetrics
+    customer_insights: CustomerInsights
+    geographic_opportunities: GeographicOpportunities
+    product_performance: ProductPerformance
+    operational_efficiency: OperationalEfficiency
+    innovation_adoption: InnovationAdoption
+
+@dataclass(slots=True, frozen=True)
+class MarketOpportunities:
+    """Рыночные возможности и потенциал роста"""
+    customer_reactivation: CustomerReactivation
+    geographic_expansion: GeographicExpansion
+    product_expansion: ProductExpansion
+
+@dataclass(slots=True, frozen=True)
+class DataPeriod:
+    """Период данных"""
+    start_date: str
+    end_date: str
+    total_days: int
+
+@dataclass(slots=True, frozen=True)
+class ExecutiveDashboard:
+    """Метрики для executive dashboard"""
+    business_health: BusinessHealth
+    market_opportunities: MarketOpportunities
+    generated_at: str
+    data_period: DataPeriod
 
 class BusinessInsightsAnalyzer:
-    def __init__(self, transaction_data_path, exchange_data_path):
+    # Колонки транзакций, используемые анализатором
+    REQUIRED_COLUMNS = [
+        'timestamp', 'amount', 'currency', 'is_fraud', 'customer_id', 'country',
+        'city', 'vendor_category', 'channel', 'device', 'is_card_present'
+    ]
+    # Колонки, переводимые в категориальный тип
+    CATEGORICAL_COLUMNS = ['currency', 'country', 'city', 'vendor_category', 'channel', 'device']
+    # Кэшируемые свойства, зависящие от df_usd
+    _CACHED_PROPERTIES = ('legit_df', 'customer_stats', 'country_stats',
+                          'business_growth_metrics', 'market_opportunities')
+
+    def __init__(self, transaction_data_path, exchange_data_path, tx_df=None, fx_df=None):
         """
         Инициализация анализатора бизнес-инсайтов
+
+        Args:
+            transaction_data_path: путь к файлу с транзакциями
+            exchange_data_path: путь к файлу с курсами валют
+            tx_df: уже загруженный DataFrame транзакций (файл не читается)
+            fx_df: уже загруженный DataFrame курсов валют (файл не читается)
+
+        Непереданные таблицы читаются через кэш DataLoader в <папка файла>/.cache
         """
-        self.df = pd.read_parquet(transaction_data_path)
-        self.exchange_df = pd.read_parquet(exchange_data_path)
+        self.df, self.exchange_df = DataLoader.load_missing(
+            transaction_data_path, exchange_data_path, self.REQUIRED_COLUMNS, tx_df=tx_df, fx_df=fx_df
+        )
         self.df_usd = None
         self._prepare_data()
 
@@ -23,242 +203,308 @@ class BusinessInsightsAnalyzer:
         """Подготовка данных для анализа"""
         # Конвертация timestamp
         self.df['timestamp'] = pd.to_datetime(self.df['timestamp'])
-        self.df['date'] = self.df['timestamp'].dt.date
-        self.exchange_df['date'] = pd.to_datetime(self.exchange_df['date']).dt.date
-
-        # Добавление временных признаков
-        self.df['hour'] = self.df['timestamp'].dt.hour
-        self.df['day_of_week'] = self.df['timestamp'].dt.dayofweek
-        self.df['week'] = self.df['timestamp'].dt.isocalendar().week
-        self.df['is_weekend'] = self.df['day_of_week'].isin([5, 6])
+        # Дата хранится как число дней от эпохи: группировка и поиск курса
+        # идут по целым числам вместо Python-объектов datetime.date
+        self.df['date_i'] = _day_numbers(self.df['timestamp'])
+        self.exchange_df['date_i'] = _day_numbers(pd.to_datetime(self.exchange_df['date']))
+
+        # Добавление временных признаков (узкие типы уменьшают память и
+        # ускоряют последующие группировки и сканирования). У NaT час и
+        # день недели - NaN, поэтому сужение до int8 только без пропусков
+        timestamp = self.df['timestamp'].dt
+        self.df['hour'] = timestamp.hour
+        self.df['day_of_week'] = timestamp.dayofweek
+        self.df['week'] = timestamp.isocalendar().week
+        if self.df['timestamp'].notna().all():
+            for col in ('hour', 'day_of_week', 'week'):
+                self.df[col] = self.df[col].astype(np.int8)
+        self.df['is_weekend'] = self.df['day_of_week'].to_numpy() >= 5
+
+        # Строковые колонки с малым числом значений хранятся как категории:
+        # группировки идут по целочисленным кодам вместо хеширования строк
+        for col in self.CATEGORICAL_COLUMNS:
+            self.df[col] = self.df[col].astype('category')
+        self.df['is_fraud'] = self.df['is_fraud'].astype(bool)
+        self.df['is_card_present'] = self.df['is_card_present'].astype(bool)
 
         # Конвертация в USD
         self._convert_to_usd()
 
     def _convert_to_usd(self):
         """Конвертация всех сумм в USD"""
-        merged_df = self.df.merge(self.exchange_df, on='date', how='left')
+        # Курс ищется по паре (дата, валюта) без соединения с таблицей курсов
+        amount_usd = DataLoader.lookup_amount_in_usd(self.df, self.exchange_df, on='date_i')
+        # Неконвертируемые строки отбрасываются той же маской, без dropna
+        # по уже собранному DataFrame
+        self.df_usd = self.df.assign(amount_usd=amount_usd)[~np.isnan(amount_usd)]
+        self._invalidate()
+
+    def _invalidate(self):
+        """Сброс кэшированных агрегатов после замены df_usd"""
+        for name in self._CACHED_PROPERTIES:
+            self.__dict__.pop(name, None)
+
+    @cached_property
+    def legit_df(self):
+        """Легитимные операции (нужны почти всем метрикам, фильтруются один раз)"""
+        return self.df_usd.loc[~self.df_usd['is_fraud']].copy()
+
+    @cached_property
+    def customer_stats(self):
+        """Агрегаты легитимных операций по клиентам (считаются один раз)"""
+        # Ключ с высокой кардинальностью (строковый customer_id) группируется
+        # многопоточной хеш-агрегацией Arrow. Строки без customer_id отбрасываются
+        # заранее: Arrow оставляет null отдельной группой, а groupby - нет
+        table = pa.Table.from_pandas(self.legit_df[['customer_id', 'amount_usd', 'timestamp']], preserve_index=False)
+        table = table.filter(pc.is_valid(table['customer_id']))
+        grouped = table.group_by('customer_id').aggregate([
+            ('amount_usd', 'sum'), ('amount_usd', 'mean'), ('amount_usd', 'count'),
+            ('timestamp', 'min'), ('timestamp', 'max')
+        ]).sort_by('customer_id')
+        customer_stats = grouped.to_pandas().set_index('customer_id')
+        customer_stats.columns = ['total_spent', 'avg_transaction', 'transaction_count', 'first_transaction', 'last_transaction']
 
-        def convert_to_usd(row):
-            currency = row['currency']
-            amount = row['amount']
+        # Производные колонки считаются на массивах numpy без промежуточных Series
+        lifetime = customer_stats['last_transaction'].to_numpy() - customer_stats['first_transaction'].to_numpy()
+        lifetime_days = lifetime // np.timedelta64(1, 'D')
+        customer_stats['customer_lifetime_days'] = lifetime_days
+        customer_stats['transactions_per_day'] = customer_stats['transaction_count'].to_numpy() / (lifetime_days + 1)
+        return customer_stats
+
+    @cached_property
+    def country_stats(self):
+        """Агрегаты легитимных операций по странам (считаются один раз)"""
+        country_stats = self.legit_df.groupby('country', observed=True).agg({
+            'amount_usd': ['sum', 'mean', 'count'],
+            'customer_id': 'nunique'
+        })
+        country_stats.columns = ['total_volume', 'avg_transaction', 'transaction_count', 'unique_customers']
+        country_stats['revenue_per_customer'] = country_stats['total_volume'] / country_stats['unique_customers']
+        return country_stats
 
-            if currency == 'USD':
-                return amount
-            elif currency in ['AUD', 'BRL', 'CAD', 'EUR', 'GBP', 'JPY', 'MXN', 'NGN', 'RUB', 'SGD']:
-                exchange_rate = row[currency]
-                if pd.notna(exchange_rate) and exchange_rate != 0:
-                    return amount / exchange_rate
-            return None
+    @cached_property
+    def business_growth_metrics(self):
+        """Метрики роста и развития бизнеса (считаются один раз)"""
+        return self.calculate_business_growth_metrics()
 
-        merged_df['amount_usd'] = merged_df.apply(convert_to_usd, axis=1)
-        self.df_usd = merged_df.dropna(subset=['amount_usd'])
+    @cached_property
+    def market_opportunities(self):
+        """Рыночные возможности (считаются один раз)"""
+        return self.calculate_market_opportunities()
 
     def calculate_business_growth_metrics(self):
         """
         Расчет метрик роста и развития бизнеса
         """
-        metrics = {}
-
         # 1. ОБЪЕМЫ И РОСТ БИЗНЕСА
-        legit_df = self.df_usd[self.df_usd['is_fraud'] == False]
+        legit_df = self.legit_df
 
         # Общие объемы
         total_volume_usd = self.df_usd['amount_usd'].sum()
         legit_volume_usd = legit_df['amount_usd'].sum()
 
         # Дневные объемы для анализа роста
-        daily_volumes = legit_df.groupby('date')['amount_usd'].sum().sort_index()
-        daily_transactions = legit_df.groupby('date').size().sort_index()
+        # groupby уже возвращает дни в порядке возрастания
+        daily_volumes = legit_df.groupby('date_i')['amount_usd'].sum()
+        daily_transactions = legit_df.groupby('date_i').size()
+
+        # Расчет трендов (первая vs последняя неделя) на срезах массивов
+        volume_values = daily_volumes.to_numpy()
+        transaction_values = daily_transactions.to_numpy()
 
-        # Расчет трендов (первая vs последняя неделя)
-        first_week_volume = daily_volumes.head(7).mean()
-        last_week_volume = daily_volumes.tail(7).mean()
+        first_week_volume = volume_values[:7].mean()
+        last_week_volume = volume_values[-7:].mean()
         volume_growth_rate = ((last_week_volume - first_week_volume) / first_week_volume) * 100
 
-        first_week_transactions = daily_transactions.head(7).mean()
-        last_week_transactions = daily_transactions.tail(7).mean()
+        first_week_transactions = transaction_values[:7].mean()
+        last_week_transactions = transaction_values[-7:].mean()
         transaction_growth_rate = ((last_week_transactions - first_week_transactions) / first_week_transactions) * 100
 
-        metrics['business_growth'] = {
-            'total_business_volume_usd': round(total_volume_usd, 2),
-            'legitimate_business_volume_usd': round(legit_volume_usd, 2),
-            'business_health_percentage': round((legit_volume_usd / total_volume_usd) * 100, 2),
-            'daily_average_volume_usd': round(daily_volumes.mean(), 2),
-            'daily_average_transactions': round(daily_transactions.mean(), 0),
-            'volume_growth_rate_percentage': round(volume_growth_rate, 2),
-            'transaction_growth_rate_percentage': round(transaction_growth_rate, 2),
-            'peak_daily_volume_usd': round(daily_volumes.max(), 2),
-            'consistent_growth_days': len(daily_volumes[daily_volumes > daily_volumes.median()])
-        }
+        business_growth = BusinessGrowthMetrics(
+            total_business_volume_usd=round(total_volume_usd, 2),
+            legitimate_business_volume_usd=round(legit_volume_usd, 2),
+            business_health_percentage=round((legit_volume_usd / total_volume_usd) * 100, 2),
+            daily_average_volume_usd=round(daily_volumes.mean(), 2),
+            daily_average_transactions=round(daily_transactions.mean(), 0),
+            volume_growth_rate_percentage=round(volume_growth_rate, 2),
+            transaction_growth_rate_percentage=round(transaction_growth_rate, 2),
+            peak_daily_volume_usd=round(daily_volumes.max(), 2),
+            consistent_growth_days=int((volume_values > np.median(volume_values)).sum())
+        )
 
         # 2. КЛИЕНТСКАЯ БАЗА И ЛОЯЛЬНОСТЬ
-        customer_stats = legit_df.groupby('customer_id').agg({
-            'amount_usd': ['sum', 'mean', 'count'],
-            'timestamp': ['min', 'max']
-        })
+        customer_stats = self.customer_stats
 
-        customer_stats.columns = ['total_spent', 'avg_transaction', 'transaction_count', 'first_transaction', 'last_transaction']
-        customer_stats['customer_lifetime_days'] = (customer_stats['last_transaction'] - customer_stats['first_transaction']).dt.days
-        customer_stats['transactions_per_day'] = customer_stats['transaction_count'] / (customer_stats['customer_lifetime_days'] + 1)
+        # Точки разбиения на сегменты и порог VIP считаются одним вызовом
+        total_spent = customer_stats['total_spent'].to_numpy()
+        *segment_cuts, vip_threshold = np.quantile(total_spent, [0.2, 0.4, 0.6, 0.8, 0.9])
 
-        # Сегментация клиентов по ценности
-        customer_stats['value_segment'] = pd.qcut(customer_stats['total_spent'],
-                                                 q=5,
-                                                 labels=['Bronze', 'Silver', 'Gold', 'Platinum', 'Diamond'])
+        # Сегментация клиентов по ценности (интервалы закрыты справа, как в pd.qcut)
+        # Размеры сегментов упорядочены по убыванию, как в value_counts()
+        segment_labels = np.array(['Bronze', 'Silver', 'Gold', 'Platinum', 'Diamond'])
+        segment_counts = np.bincount(np.searchsorted(segment_cuts, total_spent, side='left'),
+                                     minlength=len(segment_labels))
+        segment_order = np.argsort(-segment_counts, kind='stable')
 
         # VIP клиенты (топ 10% по объему)
-        vip_threshold = customer_stats['total_spent'].quantile(0.9)
-        vip_customers = customer_stats[customer_stats['total_spent'] >= vip_threshold]
-
-        metrics['customer_insights'] = {
-            'total_active_customers': len(customer_stats),
-            'average_customer_lifetime_value_usd': round(customer_stats['total_spent'].mean(), 2),
-            'median_customer_lifetime_value_usd': round(customer_stats['total_spent'].median(), 2),
-            'vip_customers_count': len(vip_customers),
-            'vip_customers_percentage': round((len(vip_customers) / len(customer_stats)) * 100, 2),
-            'vip_revenue_contribution_percentage': round((vip_customers['total_spent'].sum() / customer_stats['total_spent'].sum()) * 100, 2),
-            'average_transactions_per_customer': round(customer_stats['transaction_count'].mean(), 1),
-            'customer_retention_rate': round((len(customer_stats[customer_stats['customer_lifetime_days'] > 7]) / len(customer_stats)) * 100, 2),
-            'highly_active_customers': len(customer_stats[customer_stats['transactions_per_day'] > 1]),
-            'customer_segments': customer_stats['value_segment'].value_counts().to_dict()
-        }
+        vip_spent = total_spent[total_spent >= vip_threshold]
+
+        customer_insights = CustomerInsights(
+            total_active_customers=len(customer_stats),
+            average_customer_lifetime_value_usd=round(customer_stats['total_spent'].mean(), 2),
+            median_customer_lifetime_value_usd=round(customer_stats['total_spent'].median(), 2),
+            vip_customers_count=len(vip_spent),
+            vip_customers_percentage=round((len(vip_spent) / len(customer_stats)) * 100, 2),
+            vip_revenue_contribution_percentage=round((vip_spent.sum() / customer_stats['total_spent'].sum()) * 100, 2),
+            average_transactions_per_customer=round(customer_stats['transaction_count'].mean(), 1),
+            customer_retention_rate=round((len(customer_stats[customer_stats['customer_lifetime_days'] > 7]) / len(customer_stats)) * 100, 2),
+            highly_active_customers=len(customer_stats[customer_stats['transactions_per_day'] > 1]),
+            customer_segments=dict(zip(segment_labels[segment_order].tolist(), segment_counts[segment_order].tolist()))
+        )
 
         # 3. ГЕОГРАФИЧЕСКАЯ ЭКСПАНСИЯ И ВОЗМОЖНОСТИ
-        country_legit_stats = legit_df.groupby('country').agg({
-            'amount_usd': ['sum', 'mean', 'count'],
-            'customer_id': 'nunique'
-        })
-
-        country_legit_stats.columns = ['total_volume', 'avg_transaction', 'transaction_count', 'unique_customers']
-        country_legit_stats['revenue_per_customer'] = country_legit_stats['total_volume'] / country_legit_stats['unique_customers']
-        country_legit_stats = country_legit_stats.sort_values('total_volume', ascending=False)
+        # Из упорядоченных по обороту стран нужны только первые строки,
+        # поэтому вместо полной сортировки используется nlargest
+        country_legit_stats = self.country_stats
 
-        # Исключаем Unknown City для более точного анализа
-        country_legit_clean = legit_df[legit_df['city'] != 'Unknown City']
-        city_stats = country_legit_clean.groupby(['country', 'city']).agg({
-            'amount_usd': 'sum',
-            'customer_id': 'nunique'
-        }).reset_index()
-
-        top_markets = country_legit_stats.head(10)
+        top_markets = country_legit_stats.nlargest(10, 'total_volume')
         emerging_markets = country_legit_stats[
             (country_legit_stats['unique_customers'] >= 50) &
             (country_legit_stats['revenue_per_customer'] > country_legit_stats['revenue_per_customer'].median())
-        ].head(5)
-
-        metrics['geographic_opportunities'] = {
-            'total_countries_served': len(country_legit_stats),
-            'total_cities_served': legit_df['city'].nunique(),
-            'top_revenue_countries': top_markets.index.tolist()[:5],
-            'top_markets_revenue_usd': top_markets['total_volume'].head(5).to_dict(),
-            'emerging_high_value_markets': emerging_markets.index.tolist(),
-            'average_revenue_per_country_usd': round(country_legit_stats['total_volume'].mean(), 2),
-            'market_concentration_top5_percentage': round((top_markets['total_volume'].head(5).sum() / country_legit_stats['total_volume'].sum()) * 100, 2),
-            'international_expansion_potential': len(country_legit_stats[country_legit_stats['unique_customers'] < 100]),
-            'highest_value_per_customer_country': country_legit_stats['revenue_per_customer'].idxmax(),
-            'highest_value_per_customer_amount': round(country_legit_stats['revenue_per_customer'].max(), 2)
-        }
+        ].nlargest(5, 'total_volume')
+
+        geographic_opportunities = GeographicOpportunities(
+            total_countries_served=len(country_legit_stats),
+            total_cities_served=legit_df['city'].nunique(),
+            top_revenue_countries=top_markets.index.tolist()[:5],
+            top_markets_revenue_usd=_series_to_dict(top_markets['total_volume'].head(5)),
+            emerging_high_value_markets=emerging_markets.index.tolist(),
+            average_revenue_per_country_usd=round(country_legit_stats['total_volume'].mean(), 2),
+            market_concentration_top5_percentage=round((top_markets['total_volume'].head(5).sum() / country_legit_stats['total_volume'].sum()) * 100, 2),
+            international_expansion_potential=len(country_legit_stats[country_legit_stats['unique_customers'] < 100]),
+            highest_value_per_customer_country=country_legit_stats['revenue_per_customer'].idxmax(),
+            highest_value_per_customer_amount=round(country_legit_stats['revenue_per_customer'].max(), 2)
+        )
 
         # 4. ПРОДУКТОВАЯ ЛИНЕЙКА И КАТЕГОРИИ
-        vendor_legit_stats = legit_df.groupby('vendor_category').agg({
+        vendor_legit_stats = legit_df.groupby('vendor_category', observed=True).agg({
             'amount_usd': ['sum', 'mean', 'count'],
             'customer_id': 'nunique'
         })
-
         vendor_legit_stats.columns = ['total_revenue', 'avg_transaction', 'transaction_count', 'unique_customers']
         vendor_legit_stats['revenue_per_customer'] = vendor_legit_stats['total_revenue'] / vendor_legit_stats['unique_customers']
         vendor_legit_stats = vendor_legit_stats.sort_values('total_revenue', ascending=False)
 
         # Анализ каналов
-        channel_stats = legit_df.groupby('channel').agg({
+        channel_stats = legit_df.groupby('channel', observed=True).agg({
             'amount_usd': ['sum', 'mean', 'count']
         })
         channel_stats.columns = ['total_revenue', 'avg_transaction', 'transaction_count']
         channel_stats = channel_stats.sort_values('total_revenue', ascending=False)
 
-        metrics['product_performance'] = {
-            'most_profitable_category': vendor_legit_stats.index[0],
-            'most_profitable_category_revenue_usd': round(vendor_legit_stats.iloc[0]['total_revenue'], 2),
-            'highest_value_category': vendor_legit_stats['avg_transaction'].idxmax(),
-            'highest_avg_transaction_usd': round(vendor_legit_stats['avg_transaction'].max(), 2),
-            'category_revenue_distribution': vendor_legit_stats['total_revenue'].to_dict(),
-            'most_popular_channel': channel_stats.index[0],
-            'channel_revenue_distribution': channel_stats['total_revenue'].to_dict(),
-            'cross_selling_opportunities': len(vendor_legit_stats[vendor_legit_stats['unique_customers'] < vendor_legit_stats['unique_customers'].median()]),
-            'premium_categories_count': len(vendor_legit_stats[vendor_legit_stats['avg_transaction'] > 1000])
-        }
+        product_performance = ProductPerformance(
+            most_profitable_category=vendor_legit_stats.index[0],
+            most_profitable_category_revenue_usd=round(vendor_legit_stats.iloc[0]['total_revenue'], 2),
+            highest_value_category=vendor_legit_stats['avg_transaction'].idxmax(),
+            highest_avg_transaction_usd=round(vendor_legit_stats['avg_transaction'].max(), 2),
+            category_revenue_distribution=_series_to_dict(vendor_legit_stats['total_revenue']),
+            most_popular_channel=channel_stats.index[0],
+            channel_revenue_distribution=_series_to_dict(channel_stats['total_revenue']),
+            cross_selling_opportunities=len(vendor_legit_stats[vendor_legit_stats['unique_customers'] < vendor_legit_stats['unique_customers'].median()]),
+            premium_categories_count=len(vendor_legit_stats[vendor_legit_stats['avg_transaction'] > 1000])
+        )
 
         # 5. ОПЕРАЦИОННАЯ ЭФФЕКТИВНОСТЬ
         # Анализ по времени для оптимизации ресурсов
-        hourly_legit_stats = legit_df.groupby('hour').agg({
-            'amount_usd': ['sum', 'count', 'mean']
-        })
-        hourly_legit_stats.columns = ['total_revenue', 'transaction_count', 'avg_transaction']
-
-        peak_hours = hourly_legit_stats.nlargest(3, 'total_revenue').index.tolist()
-        peak_revenue_hours = hourly_legit_stats.nlargest(3, 'transaction_count').index.tolist()
-
-        # Анализ выходных vs будни
-        weekend_stats = legit_df[legit_df['is_weekend']].agg({
-            'amount_usd': ['sum', 'mean', 'count']
-        })
-        weekday_stats = legit_df[~legit_df['is_weekend']].agg({
-            'amount_usd': ['sum', 'mean', 'count']
-        })
-
-        metrics['operational_efficiency'] = {
-            'peak_revenue_hours': peak_hours,
-            'peak_transaction_hours': peak_revenue_hours,
-            'best_hour_revenue_usd': round(hourly_legit_stats['total_revenue'].max(), 2),
-            'weekend_vs_weekday_revenue_ratio': round(weekend_stats['amount_usd']['sum'] / weekday_stats['amount_usd']['sum'], 2),
-            'weekend_premium_percentage': round(((weekend_stats['amount_usd']['mean'] - weekday_stats['amount_usd']['mean']) / weekday_stats['amount_usd']['mean']) * 100, 2),
-            'processing_volume_per_hour_avg': round(legit_df.groupby('hour').size().mean(), 0),
-            'system_utilization_peak_ratio': round(hourly_legit_stats['transaction_count'].max() / hourly_legit_stats['transaction_count'].mean(), 2),
-            'revenue_consistency_score': round(100 - (daily_volumes.std() / daily_volumes.mean() * 100), 1)
-        }
+        # Часов в сутках 24, а признак выходного дня бинарный, поэтому
+        # агрегаты по ним считаются через np.bincount без groupby
+        amounts = legit_df['amount_usd'].to_numpy()
+        # Операции без времени (час NaN) в почасовую статистику не входят
+        hour = legit_df['hour']
+        if hour.hasnans:
+            known_hour = hour.notna().to_numpy()
+            hour_codes = hour.to_numpy()[known_hour].astype(np.intp)
+            hour_amounts = amounts[known_hour]
+        else:
+            hour_codes = hour.to_numpy()
+            hour_amounts = amounts
+        hour_counts = np.bincount(hour_codes, minlength=24)
+        hour_revenue = np.bincount(hour_codes, weights=hour_amounts, minlength=24)
+
+        # Учитываются только часы, в которые были операции
+        active_hours = np.flatnonzero(hour_counts)
+        active_hour_counts = hour_counts[active_hours]
+        active_hour_revenue = hour_revenue[active_hours]
+
+        peak_hours = active_hours[np.argsort(-active_hour_revenue, kind='stable')[:3]].tolist()
+        peak_revenue_hours = active_hours[np.argsort(-active_hour_counts, kind='stable')[:3]].tolist()
+
+        # Анализ выходных vs будни (индекс 0 - будни, 1 - выходные)
+        weekend_codes = legit_df['is_weekend'].to_numpy().astype(np.intp)
+        weekend_counts = np.bincount(weekend_codes, minlength=2)
+        weekend_revenue = np.bincount(weekend_codes, weights=amounts, minlength=2)
+        weekday_sum, weekend_sum = weekend_revenue
+        weekday_mean, weekend_mean = weekend_revenue / weekend_counts
+
+        operational_efficiency = OperationalEfficiency(
+            peak_revenue_hours=peak_hours,
+            peak_transaction_hours=peak_revenue_hours,
+            best_hour_revenue_usd=round(active_hour_revenue.max(), 2),
+            weekend_vs_weekday_revenue_ratio=round(weekend_sum / weekday_sum, 2),
+            weekend_premium_percentage=round(((weekend_mean - weekday_mean) / weekday_mean) * 100, 2),
+            processing_volume_per_hour_avg=round(active_hour_counts.mean(), 0),
+            system_utilization_peak_ratio=round(active_hour_counts.max() / active_hour_counts.mean(), 2),
+            revenue_consistency_score=round(100 - (daily_volumes.std() / daily_volumes.mean() * 100), 1)
+        )
 
         # 6. ИННОВАЦИИ И ТЕХНОЛОГИИ
-        device_stats = legit_df.groupby('device').agg({
+        device_stats = legit_df.groupby('device', observed=True).agg({
             'amount_usd': ['sum', 'count', 'mean']
         })
         device_stats.columns = ['total_revenue', 'transaction_count', 'avg_transaction']
-        device_stats = device_stats.sort_values('total_revenue', ascending=False)
+        top_device = device_stats['total_revenue'].idxmax()
 
         # Анализ современных vs традиционных каналов
         modern_devices = ['iOS App', 'Android App', 'Chrome', 'Safari', 'Edge']
-        modern_transactions = legit_df[legit_df['device'].isin(modern_devices)]
-        traditional_transactions = legit_df[~legit_df['device'].isin(modern_devices)]
-
-        card_present_stats = legit_df[legit_df['is_card_present']].agg({'amount_usd': ['sum', 'count', 'mean']})
-        card_not_present_stats = legit_df[~legit_df['is_card_present']].agg({'amount_usd': ['sum', 'count', 'mean']})
-
-        metrics['innovation_adoption'] = {
-            'top_device_by_revenue': device_stats.index[0],
-            'top_device_revenue_usd': round(device_stats.iloc[0]['total_revenue'], 2),
-            'mobile_vs_desktop_ratio': round(len(modern_transactions) / len(traditional_transactions), 2) if len(traditional_transactions) > 0 else float('inf'),
-            'digital_adoption_percentage': round((len(modern_transactions) / len(legit_df)) * 100, 2),
-            'contactless_vs_contact_ratio': round(card_not_present_stats['amount_usd']['count'] / card_present_stats['amount_usd']['count'], 2),
-            'contactless_revenue_percentage': round((card_not_present_stats['amount_usd']['sum'] / legit_df['amount_usd'].sum()) * 100, 2),
-            'device_diversity_score': len(device_stats),
-            'innovation_revenue_premium': round(((modern_transactions['amount_usd'].mean() - traditional_transactions['amount_usd'].mean()) / traditional_transactions['amount_usd'].mean()) * 100, 2) if len(traditional_transactions) > 0 else 0
-        }
-
-        return metrics
+        # Из отфильтрованных строк нужны только суммы, поэтому маски
+        # применяются к массиву сумм, а не ко всему DataFrame
+        is_modern = legit_df['device'].isin(modern_devices).to_numpy()
+        modern_amounts = amounts[is_modern]
+        traditional_amounts = amounts[~is_modern]
+
+        is_card_present = legit_df['is_card_present'].to_numpy()
+        card_present_count = np.count_nonzero(is_card_present)
+        card_not_present_count = len(is_card_present) - card_present_count
+        card_not_present_revenue = amounts[~is_card_present].sum()
+
+        innovation_adoption = InnovationAdoption(
+            top_device_by_revenue=top_device,
+            top_device_revenue_usd=round(device_stats.at[top_device, 'total_revenue'], 2),
+            mobile_vs_desktop_ratio=round(len(modern_amounts) / len(traditional_amounts), 2) if len(traditional_amounts) > 0 else float('inf'),
+            digital_adoption_percentage=round((len(modern_amounts) / len(legit_df)) * 100, 2),
+            contactless_vs_contact_ratio=round(card_not_present_count / card_present_count, 2),
+            contactless_revenue_percentage=round((card_not_present_revenue / legit_df['amount_usd'].sum()) * 100, 2),
+            device_diversity_score=len(device_stats),
+            innovation_revenue_premium=round(((modern_amounts.mean() - traditional_amounts.mean()) / traditional_amounts.mean()) * 100, 2) if len(traditional_amounts) > 0 else 0
+        )
+
+        return BusinessHealth(
+            business_growth=business_growth,
+            customer_insights=customer_insights,
+            geographic_opportunities=geographic_opportunities,
+            product_performance=product_performance,
+            operational_efficiency=operational_efficiency,
+            innovation_adoption=innovation_adoption
+        )
 
     def calculate_market_opportunities(self):
         """
         Расчет рыночных возможностей и потенциала роста
         """
-        legit_df = self.df_usd[self.df_usd['is_fraud'] == False]
-        opportunities = {}
+        legit_df = self.legit_df
 
         # 1. НЕИСПОЛЬЗОВАННЫЙ ПОТЕНЦИАЛ КЛИЕНТОВ
-        customer_activity = legit_df.groupby('customer_id').agg({
-            'amount_usd': ['sum', 'count', 'mean'],
-            'timestamp': ['min', 'max']
-        })
-        customer_activity.columns = ['total_spent', 'transaction_count', 'avg_transaction', 'first_seen', 'last_seen']
+        customer_activity = self.customer_stats
 
         # Клиенты с низкой активностью но высоким потенциалом
         low_activity_high_value = customer_activity[
@@ -269,77 +515,79 @@ class BusinessInsightsAnalyzer:
         # Клиенты, которые давно не совершали покупки
         recent_date = legit_df['timestamp'].max()
         inactive_customers = customer_activity[
-            (recent_date - customer_activity['last_seen']).dt.days > 7
+            (recent_date - customer_activity['last_transaction']).dt.days > 7
         ]
 
-        opportunities['customer_reactivation'] = {
-            'low_activity_high_value_customers': len(low_activity_high_value),
-            'potential_revenue_from_reactivation_usd': round(low_activity_high_value['avg_transaction'].sum(), 2),
-            'inactive_customers_count': len(inactive_customers),
-            'inactive_customers_lost_revenue_potential_usd': round(inactive_customers['total_spent'].sum(), 2),
-            'average_customer_upside_potential_usd': round(customer_activity['avg_transaction'].quantile(0.75) - customer_activity['avg_transaction'].median(), 2)
-        }
+        customer_reactivation = CustomerReactivation(
+            low_activity_high_value_customers=len(low_activity_high_value),
+            potential_revenue_from_reactivation_usd=round(low_activity_high_value['avg_transaction'].sum(), 2),
+            inactive_customers_count=len(inactive_customers),
+            inactive_customers_lost_revenue_potential_usd=round(inactive_customers['total_spent'].sum(), 2),
+            average_customer_upside_potential_usd=round(customer_activity['avg_transaction'].quantile(0.75) - customer_activity['avg_transaction'].median(), 2)
+        )
 
         # 2. ГЕОГРАФИЧЕСКАЯ ЭКСПАНСИЯ
-        country_performance = legit_df.groupby('country').agg({
-            'amount_usd': ['sum', 'mean'],
-            'customer_id': 'nunique'
-        })
-        country_performance.columns = ['total_revenue', 'avg_transaction', 'customer_count']
-        country_performance['revenue_per_customer'] = country_performance['total_revenue'] / country_performance['customer_count']
+        country_performance = self.country_stats
 
         # Страны с высоким потенциалом (высокий средний чек, но мало клиентов)
         high_potential_countries = country_performance[
             (country_performance['avg_transaction'] > country_performance['avg_transaction'].median()) &
-            (country_performance['customer_count'] < country_performance['customer_count'].quantile(0.75))
-        ].sort_values('avg_transaction', ascending=False)
-
-        opportunities['geographic_expansion'] = {
-            'high_potential_markets': high_potential_countries.index.tolist()[:5],
-            'expansion_revenue_potential_usd': round(high_potential_countries['avg_transaction'].sum() * 100, 2),  # Предполагаем привлечение 100 клиентов на рынок
-            'underserved_markets_count': len(country_performance[country_performance['customer_count'] < 50]),
-            'market_penetration_opportunities': len(high_potential_countries)
-        }
+            (country_performance['unique_customers'] < country_performance['unique_customers'].quantile(0.75))
+        ]
+
+        geographic_expansion = GeographicExpansion(
+            high_potential_markets=high_potential_countries.nlargest(5, 'avg_transaction').index.tolist(),
+            expansion_revenue_potential_usd=round(high_potential_countries['avg_transaction'].sum() * 100, 2),  # Предполагаем привлечение 100 клиентов на рынок
+            underserved_markets_count=len(country_performance[country_performance['unique_customers'] < 50]),
+            market_penetration_opportunities=len(high_potential_countries)
+        )
 
         # 3. ПРОДУКТОВЫЕ ВОЗМОЖНОСТИ
-        category_cross_sell = legit_df.groupby(['customer_id', 'vendor_category']).size().unstack(fill_value=0)
-        customer_category_count = (category_cross_sell > 0).sum(axis=1)
+        # Число категорий на клиента считается напрямую, без матрицы клиент x категория.
+        # Клиенты без единой известной категории (ноль) в матрицу не попадали
+        # и здесь тоже не учитываются
+        customer_category_count = legit_df.groupby('customer_id', observed=True)['vendor_category'].nunique()
+        customer_category_count = customer_category_count[customer_category_count > 0]
 
         # Клиенты, использующие только одну категорию
         single_category_customers = customer_category_count[customer_category_count == 1]
 
         # Потенциал кросс-продаж
         avg_categories_per_customer = customer_category_count.mean()
-        max_categories = len(category_cross_sell.columns)
-
-        opportunities['product_expansion'] = {
-            'single_category_customers_count': len(single_category_customers),
-            'cross_sell_potential_customers': len(customer_category_count[customer_category_count < avg_categories_per_customer]),
-            'average_categories_per_customer': round(avg_categories_per_customer, 1),
-            'max_category_utilization_potential': max_categories,
-            'category_expansion_opportunity_percentage': round(((max_categories - avg_categories_per_customer) / max_categories) * 100, 1)
-        }
-
-        return opportunities
+        max_categories = legit_df['vendor_category'].nunique()
+
+        product_expansion = ProductExpansion(
+            single_category_customers_count=len(single_category_customers),
+            cross_sell_potential_customers=len(customer_category_count[customer_category_count < avg_categories_per_customer]),
+            average_categories_per_customer=round(avg_categories_per_customer, 1),
+            max_category_utilization_potential=max_categories,
+            category_expansion_opportunity_percentage=round(((max_categories - avg_categories_per_customer) / max_categories) * 100, 1)
+        )
+
+        return MarketOpportunities(
+            customer_reactivation=customer_reactivation,
+            geographic_expansion=geographic_expansion,
+            product_expansion=product_expansion
+        )
 
     def generate_executive_dashboard_metrics(self):
         """
         Генерация метрик для executive dashboard
         """
-        business_metrics = self.calculate_business_growth_metrics()
-        opportunities = self.calculate_market_opportunities()
+        business_metrics = self.business_growth_metrics
+        opportunities = self.market_opportunities
 
         # Объединение всех метрик
-        dashboard = {
-            'business_health': business_metrics,
-            'market_opportunities': opportunities,
-            'generated_at': datetime.now().isoformat(),
-            'data_period': {
-                'start_date': str(self.df_usd['timestamp'].min().date()),
-                'end_date': str(self.df_usd['timestamp'].max().date()),
-                'total_days': (self.df_usd['timestamp'].max() - self.df_usd['timestamp'].min()).days
-            }
-        }
+        dashboard = ExecutiveDashboard(
+            business_health=business_metrics,
+            market_opportunities=opportunities,
+            generated_at=datetime.now().isoformat(),
+            data_period=DataPeriod(
+                start_date=str(self.df_usd['timestamp'].min().date()),
+                end_date=str(self.df_usd['timestamp'].max().date()),
+                total_days=(self.df_usd['timestamp'].max() - self.df_usd['timestamp'].min()).days
+            )
+        )
 
         return dashboard
 
@@ -347,58 +595,63 @@ class BusinessInsightsAnalyzer:
         """
         Сохранение бизнес-инсайтов
         """
-        import os
-        os.makedirs(output_dir, exist_ok=True)
-
         dashboard = self.generate_executive_dashboard_metrics()
 
-        # Сохранение в JSON
-        with open(f'{output_dir}/business_insights.json', 'w', encoding='utf-8') as f:
-            json.dump(dashboard, f, indent=2, ensure_ascii=False)
+        self.write_business_insights(dashboard, output_dir)
+        return dashboard
 
-        # Создание краткого executive summary
-        summary = self._generate_business_summary(dashboard)
-        with open(f'{output_dir}/business_executive_summary.md', 'w', encoding='utf-8') as f:
-            f.write(summary)
+    @classmethod
+    def write_business_insights(cls, dashboard, output_dir='results'):
+        """
+        Запись готовых бизнес-инсайтов в файлы (в том числе взятых из кэша)
+        """
+        os.makedirs(output_dir, exist_ok=True)
 
-        return dashboard
+        # Все файлы сериализуются заранее и записываются на диск параллельно
+        outputs = {
+            f'{output_dir}/business_insights.json': orjson.dumps(dashboard, option=JSON_OPTIONS),
+            # Краткий executive summary
+            f'{output_dir}/business_executive_summary.md': cls._generate_business_summary(dashboard).encode('utf-8')
+        }
+        write_files(outputs)
 
-    def _generate_business_summary(self, dashboard):
+    @staticmethod
+    def _generate_business_summary(dashboard):
         """
         Генерация краткого бизнес-отчета
         """
-        bg = dashboard['business_health']['business_growth']
-        ci = dashboard['business_health']['customer_insights']
-        geo = dashboard['business_health']['geographic_opportunities']
+        bg = dashboard.business_health.business_growth
+        ci = dashboard.business_health.customer_insights
+        geo = dashboard.business_health.geographic_opportunities
 
         summary = f"""# Executive Business Summary
 
 ## 🚀 Ключевые показатели роста
 
-**Общий оборот бизнеса:** ${bg['legitimate_business_volume_usd']:,.2f}
-**Здоровье бизнеса:** {bg['business_health_percentage']:.1f}% (доля легитимных операций)
-**Рост объемов:** {bg['volume_growth_rate_percentage']:+.1f}% за период
-**Рост транзакций:** {bg['transaction_growth_rate_percentage']:+.1f}% за период
+**Общий оборот бизнеса:** ${bg.legitimate_business_volume_usd:,.2f}
+**Здоровье бизнеса:** {bg.business_health_percentage:.1f}% (доля легитимных операций)
+**Рост объемов:** {bg.volume_growth_rate_percentage:+.1f}% за период
+**Рост транзакций:** {bg.transaction_growth_rate_percentage:+.1f}% за период
 
 ## 👥 Клиентская база
 
-**Активных клиентов:** {ci['total_active_customers']:,}
-**Средняя ценность клиента:** ${ci['average_customer_lifetime_value_usd']:,.2f}
-**VIP клиенты:** {ci['vip_customers_count']:,} ({ci['vip_customers_percentage']:.1f}%)
-**Вклад VIP в выручку:** {ci['vip_revenue_contribution_percentage']:.1f}%
+**Активных клиентов:** {ci.total_active_customers:,}
+**Средняя ценность клиента:** ${ci.average_customer_lifetime_value_usd:,.2f}
+**VIP клиенты:** {ci.vip_customers_count:,} ({ci.vip_customers_percentage:.1f}%)
+**Вклад VIP в выручку:** {ci.vip_revenue_contribution_percentage:.1f}%
 
 ## 🌍 География бизнеса
 
-**Стран присутствия:** {geo['total_countries_served']}
-**Городов присутствия:** {geo['total_cities_served']}
-**Топ-5 рынков:** {', '.join(geo['top_revenue_countries'])}
-**Концентрация топ-5:** {geo['market_concentration_top5_percentage']:.1f}% выручки
+**Стран присутствия:** {geo.total_countries_served}
+**Городов присутствия:** {geo.total_cities_served}
+**Топ-5 рынков:** {', '.join(geo.top_revenue_countries)}
+**Концентрация топ-5:** {geo.market_concentration_top5_percentage:.1f}% выручки
 
 ## 💡 Возможности роста
 
-**Потенциал реактивации клиентов:** ${dashboard['market_opportunities']['customer_reactivation']['potential_revenue_from_reactivation_usd']:,.2f}
-**Рынки для экспансии:** {dashboard['market_opportunities']['geographic_expansion']['high_potential_markets'][:3]}
-**Клиенты для кросс-продаж:** {dashboard['market_opportunities']['product_expansion']['cross_sell_potential_customers']:,}
+**Потенциал реактивации клиентов:** ${dashboard.market_opportunities.customer_reactivation.potential_revenue_from_reactivation_usd:,.2f}
+**Рынки для экспансии:** {dashboard.market_opportunities.geographic_expansion.high_potential_markets[:3]}
+**Клиенты для кросс-продаж:** {dashboard.market_opportunities.product_expansion.cross_sell_potential_customers:,}
 
 ---
 *Отчет сгенерирован: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}*
@@ -2,13 +2,29 @@
 Модуль для загрузки и предобработки данных
 """
 
+import hashlib
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
-from typing import Tuple, Optional
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from typing import List, Tuple, Optional
 
 class DataLoader:
     """Класс для загрузки и предобработки данных о транзакциях"""
 
+    # Размер батча при потоковом чтении parquet
+    BATCH_SIZE = 1_000_000
+
+    # Валюты, для которых в таблице курсов есть колонка с курсом к USD
+    CURRENCIES = ['AUD', 'BRL', 'CAD', 'EUR', 'GBP', 'JPY', 'MXN', 'NGN', 'RUB', 'SGD']
+
+    # Признак ночного часа (22:00-06:59) для каждого часа суток
+    NIGHT_HOURS = np.array([True] * 7 + [False] * 15 + [True] * 2)
+
     def __init__(self, transaction_path: str, exchange_path: str):
         """
         Инициализация загрузчика данных
@@ -22,16 +38,184 @@ class DataLoader:
         self.df = None
         self.exchange_df = None
 
-    def load_data(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    @staticmethod
+    def prepare_cache(path: str, columns: Optional[List[str]] = None,
+                      cache_dir: Optional[str] = None) -> str:
+        """
+        Подготовка кэша parquet-файла в формате Arrow IPC (feather)
+
+        Кэш привязан к mtime и размеру исходного файла, а также к набору
+        колонок, поэтому при их изменении файл будет прочитан заново.
+
+        Args:
+            path: путь к parquet-файлу
+            columns: список колонок для чтения (если None, читаются все)
+            cache_dir: папка для кэша (по умолчанию <папка файла>/.cache)
+
+        Returns:
+            Путь к IPC-файлу кэша
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(path), '.cache')
+
+        st = os.stat(path)
+        name = os.path.splitext(os.path.basename(path))[0]
+        stamp = f"{st.st_mtime_ns}_{st.st_size}"
+        key = f"{name}_{stamp}"
+        if columns is not None:
+            key += '_' + hashlib.md5(','.join(columns).encode('utf-8')).hexdigest()[:8]
+        cache_path = os.path.join(cache_dir, f"{key}.feather")
+
+        if not os.path.exists(cache_path):
+            os.makedirs(cache_dir, exist_ok=True)
+            DataLoader._evict_stale_cache(cache_dir, name, stamp)
+            # Запись во временный файл и атомарная замена: кэш может
+            # заполняться одновременно из нескольких процессов
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            try:
+                DataLoader._write_ipc_streaming(path, tmp_path, columns)
+                os.replace(tmp_path, cache_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+
+        return cache_path
+
+    @staticmethod
+    def _evict_stale_cache(cache_dir: str, name: str, stamp: str) -> None:
+        """
+        Удаление кэшей файла name, созданных для другой версии файла
+
+        Кэши текущей версии (mtime и размер из stamp) сохраняются для всех
+        наборов колонок: их одновременно используют разные анализаторы.
+        """
+        pattern = re.compile(rf"{re.escape(name)}_(\d+_\d+)(_[0-9a-f]{{8}})?\.feather(\.\d+\.tmp)?")
+        for entry in os.listdir(cache_dir):
+            match = pattern.fullmatch(entry)
+            if match is not None and match.group(1) != stamp:
+                try:
+                    os.unlink(os.path.join(cache_dir, entry))
+                except FileNotFoundError:
+                    pass
+
+    @staticmethod
+    def _read_parquet_cached(path: str, columns: Optional[List[str]] = None,
+                             cache_dir: Optional[str] = None) -> pd.DataFrame:
+        """
+        Чтение parquet-файла через кэш в формате Arrow IPC (feather)
+
+        Args:
+            path: путь к parquet-файлу
+            columns: список колонок для чтения (если None, читаются все)
+            cache_dir: папка для кэша (по умолчанию <папка файла>/.cache)
+
+        Returns:
+            DataFrame с содержимым файла
+        """
+        cache_path = DataLoader.prepare_cache(path, columns, cache_dir)
+
+        # Файл отображается в память и читается без промежуточных буферов.
+        # При конвертации в pandas колонки копируются в блоки DataFrame:
+        # представления поверх отображенного файла были бы только для чтения,
+        # а вызывающий код должен получать изменяемые таблицы
+        return feather.read_table(cache_path, memory_map=True).to_pandas()
+
+    @staticmethod
+    def _write_ipc_streaming(path: str, ipc_path: str, columns: Optional[List[str]] = None,
+                             batch_size: int = BATCH_SIZE) -> None:
+        """
+        Потоковая перепаковка parquet-файла в Arrow IPC по батчам
+
+        В памяти одновременно находится не больше одного батча, поэтому
+        пиковое потребление памяти не зависит от размера файла.
+
+        Args:
+            path: путь к parquet-файлу
+            ipc_path: путь к создаваемому IPC-файлу
+            columns: список колонок для чтения (если None, читаются все)
+            batch_size: количество строк в одном батче
+        """
+        parquet_file = pq.ParquetFile(path)
+        schema = parquet_file.schema_arrow
+        if columns is not None:
+            schema = pa.schema([schema.field(c) for c in columns], metadata=schema.metadata)
+
+        batches = parquet_file.iter_batches(batch_size=batch_size, columns=columns, use_threads=True)
+
+        # Следующий батч декодируется в фоне, пока текущий записывается на диск
+        with pa.ipc.new_file(ipc_path, schema) as writer, ThreadPoolExecutor(max_workers=1) as prefetch:
+            future = prefetch.submit(next, batches, None)
+            while (batch := future.result()) is not None:
+                future = prefetch.submit(next, batches, None)
+                writer.write_batch(batch)
+
+    @classmethod
+    def load_cached(cls, transaction_path: str, exchange_path: str,
+                    columns: Optional[List[str]] = None,
+                    cache_dir: Optional[str] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Загрузка транзакций и курсов валют с кэшированием на диске
+
+        Args:
+            transaction_path: путь к файлу с транзакциями
+            exchange_path: путь к файлу с курсами валют
+            columns: колонки транзакций для чтения (если None, читаются все)
+            cache_dir: папка для кэша (по умолчанию <папка файла>/.cache)
+
+        Returns:
+            Tuple с DataFrame транзакций и курсов валют
+        """
+        # Курсы валют читаются в фоновом потоке параллельно с транзакциями
+        with ThreadPoolExecutor(max_workers=1) as prefetch:
+            fx_future = prefetch.submit(cls._read_parquet_cached, exchange_path, cache_dir=cache_dir)
+            tx_df = cls._read_parquet_cached(transaction_path, columns, cache_dir)
+            fx_df = fx_future.result()
+        return tx_df, fx_df
+
+    @classmethod
+    def load_missing(cls, transaction_path: str, exchange_path: str,
+                     columns: Optional[List[str]] = None,
+                     tx_df: Optional[pd.DataFrame] = None,
+                     fx_df: Optional[pd.DataFrame] = None,
+                     cache_dir: Optional[str] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Загрузка только тех таблиц, которые не были переданы готовыми
+
+        Отсутствующие таблицы читаются через кэш Arrow IPC (см. prepare_cache),
+        который создается в cache_dir (по умолчанию <папка файла>/.cache).
+
+        Args:
+            transaction_path: путь к файлу с транзакциями
+            exchange_path: путь к файлу с курсами валют
+            columns: колонки транзакций для чтения (если None, читаются все)
+            tx_df: уже загруженный DataFrame транзакций (файл не читается)
+            fx_df: уже загруженный DataFrame курсов валют (файл не читается)
+            cache_dir: папка для кэша
+
+        Returns:
+            Tuple с DataFrame транзакций и курсов валют
+        """
+        if tx_df is None:
+            tx_df = cls._read_parquet_cached(transaction_path, columns, cache_dir)
+        if fx_df is None:
+            fx_df = cls._read_parquet_cached(exchange_path, cache_dir=cache_dir)
+        return tx_df, fx_df
+
+    def load_data(self, columns: Optional[List[str]] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
         """
         Загрузка данных из файлов
 
+        Args:
+            columns: колонки транзакций для чтения (если None, читаются все).
+                Parquet хранит данные по колонкам, поэтому неиспользуемые
+                колонки (например, вложенная last_hour_activity) не декодируются
+
         Returns:
             Tuple с DataFrame транзакций и курсов валют
         """
         print("Загрузка данных...")
-        self.df = pd.read_parquet(self.transaction_path)
-        self.exchange_df = pd.read_parquet(self.exchange_path)
+        self.df = pd.read_parquet(self.transaction_path, columns=columns, engine='pyarrow')
+        self.exchange_df = pd.read_parquet(self.exchange_path, engine='pyarrow')
 
         print(f"Загружено транзакций: {len(self.df):,}")
         print(f"Загружено курсов валют: {len(self.exchange_df):,}")
@@ -58,18 +242,24 @@ class DataLoader:
         self.df['day_of_week'] = self.df['timestamp'].dt.dayofweek
         self.df['day_name'] = self.df['timestamp'].dt.day_name()
         self.df['is_weekend'] = self.df['day_of_week'].isin([5, 6])
-        self.df['is_night'] = (self.df['hour'] >= 22) | (self.df['hour'] <= 6)
-
-        # Извлечение данных из last_hour_activity
-        self.df['unique_merchants'] = self.df['last_hour_activity'].apply(
-            lambda x: x['unique_merchants'] if x and 'unique_merchants' in x else None
-        )
-        self.df['num_transactions_last_hour'] = self.df['last_hour_activity'].apply(
-            lambda x: x['num_transactions'] if x and 'num_transactions' in x else None
-        )
-        self.df['total_amount_last_hour'] = self.df['last_hour_activity'].apply(
-            lambda x: x['total_amount'] if x and 'total_amount' in x else None
-        )
+        # Одна выборка из таблицы по часу вместо двух сравнений и OR
+        self.df['is_night'] = self.night_hours_mask(self.df['hour'])
+
+        # Извлечение данных из last_hour_activity: колонка один раз
+        # переводится в Arrow struct, поля берутся как дочерние массивы.
+        # flatten() учитывает пропуски родительской структуры. Полностью пустая
+        # колонка определяется Arrow как null, а не struct - тогда полей нет.
+        # Если колонка не загружена (load_data с columns), признаки активности
+        # не добавляются
+        if 'last_hour_activity' in self.df.columns:
+            activity = pa.array(self.df['last_hour_activity'], from_pandas=True)
+            activity_fields = (dict(zip((field.name for field in activity.type), activity.flatten()))
+                               if pa.types.is_struct(activity.type) else {})
+            for column, field in (('unique_merchants', 'unique_merchants'),
+                                  ('num_transactions_last_hour', 'num_transactions'),
+                                  ('total_amount_last_hour', 'total_amount')):
+                values = activity_fields.get(field)
+                self.df[column] = values.to_numpy(zero_copy_only=False) if values is not None else None
 
         print("Предобработка данных завершена")
         return self.df
@@ -86,25 +276,88 @@ class DataLoader:
 
         # Соединение с курсами валют
         merged_df = self.df.merge(self.exchange_df, on='date', how='left')
-
-        def convert_amount(row):
-            currency = row['currency']
-            amount = row['amount']
-
-            if currency == 'USD':
-                return amount
-            elif currency in ['AUD', 'BRL', 'CAD', 'EUR', 'GBP', 'JPY', 'MXN', 'NGN', 'RUB', 'SGD']:
-                exchange_rate = row[currency]
-                if pd.notna(exchange_rate) and exchange_rate != 0:
-                    return amount / exchange_rate
-            return None
-
-        merged_df['amount_usd'] = merged_df.apply(convert_amount, axis=1)
+        merged_df['amount_usd'] = self.amount_in_usd(merged_df)
         df_usd = merged_df.dropna(subset=['amount_usd'])
 
         print(f"Успешно конвертировано транзакций: {len(df_usd):,}")
         return df_usd
 
+    @classmethod
+    def amount_in_usd(cls, merged_df: pd.DataFrame) -> np.ndarray:
+        """
+        Векторная конвертация сумм в USD по курсам, присоединенным к транзакциям
+
+        Для каждой строки курс выбирается из колонки ее валюты. Для USD курс
+        равен 1; для неизвестных валют, пропущенных и нулевых курсов
+        результат - NaN.
+
+        Args:
+            merged_df: транзакции, соединенные с таблицей курсов по дате
+
+        Returns:
+            Массив сумм в USD
+        """
+        currency = merged_df['currency'].to_numpy()
+        codes = pd.Categorical(currency, categories=cls.CURRENCIES).codes
+        rates = merged_df[cls.CURRENCIES].to_numpy(dtype=np.float64)
+
+        rate = rates[np.arange(len(rates)), codes]
+        rate[codes < 0] = np.nan
+        rate[currency == 'USD'] = 1.0
+        rate[rate == 0] = np.nan
+
+        return merged_df['amount'].to_numpy(dtype=np.float64) / rate
+
+    @classmethod
+    def lookup_amount_in_usd(cls, df: pd.DataFrame, exchange_df: pd.DataFrame,
+                             on: str = 'date') -> np.ndarray:
+        """
+        Конвертация сумм в USD без соединения транзакций с таблицей курсов
+
+        Курсы собираются в плотную матрицу дата x валюта, и курс каждой
+        транзакции берется из нее одной выборкой по кодам даты и валюты.
+        Правила для USD, неизвестных валют, пропущенных и нулевых курсов
+        те же, что в amount_in_usd.
+
+        Args:
+            df: транзакции с колонками даты, currency и amount
+            exchange_df: курсы валют с колонкой даты и колонками валют
+            on: имя колонки даты в обеих таблицах
+
+        Returns:
+            Массив сумм в USD
+        """
+        # Код -1 (дата без курсов или неизвестная валюта) попадает в
+        # последнюю строку/колонку: там курс 1 для USD и NaN для остальных
+        date_codes = pd.Index(exchange_df[on]).get_indexer(df[on])
+        currency_codes = pd.Categorical(df['currency'], categories=['USD'] + cls.CURRENCIES).codes
+
+        n_dates = len(exchange_df)
+        rate_matrix = np.full((n_dates + 1, len(cls.CURRENCIES) + 2), np.nan)
+        rate_matrix[:, 0] = 1.0
+        rate_matrix[:n_dates, 1:-1] = exchange_df[cls.CURRENCIES].to_numpy(dtype=np.float64)
+        rate_matrix[rate_matrix == 0] = np.nan
+
+        rate = rate_matrix[date_codes, currency_codes]
+        return df['amount'].to_numpy(dtype=np.float64) / rate
+
+    @classmethod
+    def night_hours_mask(cls, hour: pd.Series) -> np.ndarray:
+        """
+        Признак ночного часа (22:00-06:59) одной выборкой из таблицы NIGHT_HOURS
+
+        Args:
+            hour: часы операций; у операций без времени (NaT) час - NaN
+
+        Returns:
+            Булев массив; операции без времени ночными не считаются
+        """
+        values = hour.to_numpy()
+        if values.dtype.kind != 'f':
+            return cls.NIGHT_HOURS[values]
+        missing = np.isnan(values)
+        return ~missing & cls.NIGHT_HOURS[np.where(missing, 0, values).astype(np.intp)]
+
     def get_basic_stats(self, df: Optional[pd.DataFrame] = None) -> dict:
         """
         Получение базовой статистики по данным
@@ -121,6 +374,7 @@ class DataLoader:
         if df is None:
             raise ValueError("Данные не загружены")
 
+        currency_counts = df['currency'].value_counts()
         stats = {
             'total_transactions': len(df),
             'unique_customers': df['customer_id'].nunique(),
@@ -134,7 +388,7 @@ class DataLoader:
                 'fraud_rate': df['is_fraud'].mean(),
                 'fraud_percentage': df['is_fraud'].mean() * 100
             },
-            'currencies': df['currency'].value_counts().to_dict(),
+            'currencies': dict(zip(currency_counts.index.tolist(), currency_counts.to_numpy().tolist())),
             'countries': df['country'].nunique(),
             'vendor_categories': df['vendor_category'].nunique()
         }
@@ -4,202 +4,421 @@
 
 import pandas as pd
 import numpy as np
-import json
+import pyarrow as pa
+import orjson
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
 from datetime import datetime
 import math
+import os
+from data_loader import DataLoader
+from results_io import JSON_OPTIONS, write_files
+
+# Папка с шаблонами отчетов
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
+
+@lru_cache(maxsize=None)
+def _summary_template():
+    """Шаблон краткого отчета templates/executive_summary.md.j2 (компилируется один раз на процесс)"""
+    from jinja2 import Environment, FileSystemLoader
+    env = Environment(loader=FileSystemLoader(TEMPLATES_DIR), autoescape=False, keep_trailing_newline=True)
+    env.filters['fmt'] = format
+    return env.get_template('executive_summary.md.j2')
+
+def _rounded(metrics_cls, decimals, **values):
+    """Создание раздела метрик, все значения которого округляются одним вызовом np.round"""
+    rounded = np.round(np.fromiter(values.values(), dtype=np.float64, count=len(values)), decimals)
+    return metrics_cls(**dict(zip(values, rounded)))
+
+def _masked_rates(flags, mask):
+    """Доли установленных флагов внутри маски и вне ее (по счетчикам, без выборки строк)"""
+    in_count = np.count_nonzero(mask)
+    in_flags = np.count_nonzero(flags & mask)
+    out_flags = np.count_nonzero(flags) - in_flags
+    return np.float64(in_flags) / in_count, np.float64(out_flags) / (len(mask) - in_count)
+
+def _fraud_stats_by_code(codes, is_fraud, labels):
+    """
+    Число операций, число и доля мошеннических операций по группам
+
+    Группы задаются целочисленными кодами (код -1 - пропуск, в статистику
+    не входит), агрегаты считаются двумя проходами np.bincount без
+    хеширования ключей. В результат попадают только непустые группы.
+    """
+    shifted = codes.astype(np.intp) + 1
+    count = np.bincount(shifted, minlength=len(labels) + 1)[1:]
+    fraud = np.bincount(shifted, weights=is_fraud, minlength=len(labels) + 1)[1:].astype(np.int64)
+    observed = count > 0
+    count, fraud = count[observed], fraud[observed]
+    return pd.DataFrame({'count': count, 'sum': fraud, 'mean': fraud / count}, index=labels[observed])
+
+@dataclass(slots=True, frozen=True)
+class FinancialMetrics:
+    """Финансовые метрики"""
+    total_fraud_loss_usd: float
+    total_transaction_volume_usd: float
+    fraud_loss_percentage: float
+    average_fraud_amount_usd: float
+    average_legit_amount_usd: float
+    fraud_amount_multiplier: float
+
+@dataclass(slots=True, frozen=True)
+class OperationalMetrics:
+    """Операционные метрики"""
+    total_transactions: int
+    fraud_transactions: int
+    fraud_rate_percentage: float
+    transactions_per_day: float
+    fraud_transactions_per_day: float
+    unique_customers: int
+    avg_transactions_per_customer: float
+
+@dataclass(slots=True, frozen=True)
+class GeographicRiskMetrics:
+    """Географические риски"""
+    top_risk_countries: dict
+    countries_with_fraud: int
+    high_risk_countries_count: int
+
+@dataclass(slots=True, frozen=True)
+class TemporalPatternMetrics:
+    """Временные паттерны"""
+    peak_fraud_hour: int
+    peak_fraud_rate: float
+    night_fraud_rate: float
+    day_fraud_rate: float
+    night_vs_day_risk_ratio: float
+
+@dataclass(slots=True, frozen=True)
+class BehavioralMetrics:
+    """Поведенческие метрики"""
+    high_activity_customers_count: int
+    high_activity_customers_percentage: float
+    high_activity_fraud_rate: float
+    median_unique_merchants_95th_percentile: float
+    avg_customer_unique_merchants: float
+
+@dataclass(slots=True, frozen=True)
+class VendorRiskMetrics:
+    """Риски по категориям продавцов"""
+    high_risk_vendor_fraud_rate: float
+    low_risk_vendor_fraud_rate: float
+    risk_vendor_multiplier: float
+    riskiest_vendor_category: str
+    riskiest_category_fraud_rate: float
+
+@dataclass(slots=True, frozen=True)
+class DeviceChannelMetrics:
+    """Риски по каналам и устройствам"""
+    riskiest_device: str
+    riskiest_device_fraud_rate: float
+    riskiest_channel: str
+    riskiest_channel_fraud_rate: float
+    card_present_fraud_rate: float
+    card_not_present_fraud_rate: float
+
+@dataclass(slots=True, frozen=True)
+class PotentialImpactMetrics:
+    """Потенциальная экономия"""
+    potential_savings_50_percent_usd: float
+    potential_savings_80_percent_usd: float
+    monthly_fraud_loss_usd: float
+    annual_fraud_loss_projection_usd: float
+
+@dataclass(slots=True, frozen=True)
+class FraudMetrics:
+    """Ключевые бизнес-метрики антифрод системы"""
+    financial: FinancialMetrics
+    operational: OperationalMetrics
+    geographic_risk: GeographicRiskMetrics
+    temporal_patterns: TemporalPatternMetrics
+    behavioral: BehavioralMetrics
+    vendor_risk: VendorRiskMetrics
+    device_channel: DeviceChannelMetrics
+    potential_impact: PotentialImpactMetrics
 
 class FraudAnalyzer:
-    def __init__(self, transaction_data_path, exchange_data_path):
+    # Колонки транзакций, используемые анализатором
+    REQUIRED_COLUMNS = [
+        'timestamp', 'amount', 'currency', 'is_fraud', 'customer_id', 'country',
+        'vendor_category', 'is_high_risk_vendor', 'device', 'channel',
+        'is_card_present', 'last_hour_activity'
+    ]
+    # Колонки, переводимые в категориальный тип
+    CATEGORICAL_COLUMNS = ['currency', 'customer_id', 'country', 'vendor_category', 'device', 'channel']
+    # Кэшируемые свойства, зависящие от df_usd
+    _CACHED_PROPERTIES = ('country_fraud_stats', 'hourly_fraud_stats', 'vendor_fraud_stats')
+
+    def __init__(self, transaction_data_path, exchange_data_path, tx_df=None, fx_df=None):
         """
         Инициализация анализатора мошенничества
 
         Args:
             transaction_data_path: путь к файлу с транзакциями
             exchange_data_path: путь к файлу с курсами валют
+            tx_df: уже загруженный DataFrame транзакций (файл не читается)
+            fx_df: уже загруженный DataFrame курсов валют (файл не читается)
+
+        Непереданные таблицы читаются через кэш DataLoader в <папка файла>/.cache
         """
-        self.df = pd.read_parquet(transaction_data_path)
-        self.exchange_df = pd.read_parquet(exchange_data_path)
+        self.df, self.exchange_df = DataLoader.load_missing(
+            transaction_data_path, exchange_data_path, self.REQUIRED_COLUMNS, tx_df=tx_df, fx_df=fx_df
+        )
         self.df_usd = None  # Данные с суммами в USD
         self._prepare_data()
 
     def _prepare_data(self):
         """Подготовка данных для анализа"""
-        # Конвертация timestamp
-        self.df['timestamp'] = pd.to_datetime(self.df['timestamp'])
-        self.df['date'] = self.df['timestamp'].dt.date
-        self.exchange_df['date'] = pd.to_datetime(self.exchange_df['date']).dt.date
+        # timestamp читается из parquet уже как datetime64, разбор нужен только для строк
+        if not pd.api.types.is_datetime64_any_dtype(self.df['timestamp']):
+            self.df['timestamp'] = pd.to_datetime(self.df['timestamp'])
+        timestamp = self.df['timestamp'].dt
+
+        # Даты хранятся как datetime64 (полночь), а не как объекты datetime.date:
+        # соединение с курсами идет по числовой колонке
+        self.df['date'] = timestamp.normalize()
+        self.exchange_df['date'] = pd.to_datetime(self.exchange_df['date'])
 
         # Добавление временных признаков
-        self.df['hour'] = self.df['timestamp'].dt.hour
-        self.df['day_of_week'] = self.df['timestamp'].dt.dayofweek
-        self.df['is_night'] = (self.df['hour'] >= 22) | (self.df['hour'] <= 6)
+        # У операций без времени (NaT) час и день недели - NaN, поэтому
+        # узкий целый тип используется только при отсутствии пропусков
+        hour = timestamp.hour
+        day_of_week = timestamp.dayofweek
+        if self.df['timestamp'].notna().all():
+            hour = hour.astype(np.int8)
+            day_of_week = day_of_week.astype(np.int8)
+        self.df['hour'] = hour
+        self.df['day_of_week'] = day_of_week
+        # Ночные часы определяются одной выборкой из таблицы по часу
+        self.df['is_night'] = DataLoader.night_hours_mask(hour)
+
+        # Ключи группировок хранятся как категории: все группировки идут
+        # по общим целочисленным кодам вместо повторного хеширования строк
+        for col in self.CATEGORICAL_COLUMNS:
+            self.df[col] = self.df[col].astype('category')
+        # Флаги хранятся как bool (1 байт на строку): доли и суммы по ним
+        # считаются по однобайтовым массивам
+        for col in ('is_fraud', 'is_high_risk_vendor', 'is_card_present'):
+            self.df[col] = self.df[col].astype(bool)
 
         # Конвертация в USD
         self._convert_to_usd()
 
     def _convert_to_usd(self):
         """Конвертация всех сумм в USD"""
-        merged_df = self.df.merge(self.exchange_df, on='date', how='left')
-
-        def convert_to_usd(row):
-            currency = row['currency']
-            amount = row['amount']
-
-            if currency == 'USD':
-                return amount
-            elif currency in ['AUD', 'BRL', 'CAD', 'EUR', 'GBP', 'JPY', 'MXN', 'NGN', 'RUB', 'SGD']:
-                exchange_rate = row[currency]
-                if pd.notna(exchange_rate) and exchange_rate != 0:
-                    return amount / exchange_rate
-            return None
-
-        merged_df['amount_usd'] = merged_df.apply(convert_to_usd, axis=1)
-        self.df_usd = merged_df.dropna(subset=['amount_usd'])
+        # Курс каждой транзакции берется из матрицы дата x валюта одной выборкой,
+        # без соединения, размножающего колонки курсов на все строки
+        amount_usd = DataLoader.lookup_amount_in_usd(self.df, self.exchange_df, on='date')
+        self.df_usd = self.df.assign(amount_usd=amount_usd)[~np.isnan(amount_usd)]
+        self._invalidate()
+
+    def _invalidate(self):
+        """Сброс кэшированных агрегатов после замены df_usd"""
+        for name in self._CACHED_PROPERTIES:
+            self.__dict__.pop(name, None)
+
+    @cached_property
+    def country_fraud_stats(self):
+        """Статистика мошенничества по странам (общая для метрик и риск-скоров)"""
+        return self.df_usd.groupby('country', observed=True).agg(
+            total_transactions=('is_fraud', 'count'),
+            fraud_transactions=('is_fraud', 'sum'),
+            fraud_rate=('is_fraud', 'mean'),
+            total_volume_usd=('amount_usd', 'sum')
+        )
+
+    @cached_property
+    def hourly_fraud_stats(self):
+        """Статистика мошенничества по часам (общая для метрик и риск-скоров)"""
+        # Операции без времени (час NaN) получают код -1 и в статистику не входят
+        hour = self.df_usd['hour']
+        hour_codes = hour.fillna(-1).to_numpy(dtype=np.intp) if hour.hasnans else hour.to_numpy()
+        return _fraud_stats_by_code(hour_codes, self.df_usd['is_fraud'].to_numpy(), pd.RangeIndex(24))
+
+    @cached_property
+    def vendor_fraud_stats(self):
+        """Статистика мошенничества по категориям продавцов (общая для метрик и риск-скоров)"""
+        return self.df_usd.groupby('vendor_category', observed=True).agg(
+            total_transactions=('is_fraud', 'count'),
+            fraud_transactions=('is_fraud', 'sum'),
+            fraud_rate=('is_fraud', 'mean'),
+            total_volume_usd=('amount_usd', 'sum'),
+            avg_amount_usd=('amount_usd', 'mean')
+        )
 
     def calculate_key_business_metrics(self):
         """
         Расчет ключевых бизнес-метрик для антифрод системы
+
+        Returns:
+            FraudMetrics с разделами метрик в виде dataclass-объектов
         """
-        metrics = {}
+        # Горячие колонки извлекаются один раз как numpy-массивы: скалярные
+        # суммы, доли и маски дальше считаются по ним без накладных расходов Series
+        is_fraud = self.df_usd['is_fraud'].to_numpy()
+        amount_usd = self.df_usd['amount_usd'].to_numpy()
+        is_night = self.df_usd['is_night'].to_numpy()
+        is_high_risk_vendor = self.df_usd['is_high_risk_vendor'].to_numpy()
+        is_card_present = self.df_usd['is_card_present'].to_numpy()
 
         # 1. ФИНАНСОВЫЕ МЕТРИКИ
-        fraud_df = self.df_usd[self.df_usd['is_fraud'] == True]
-        legit_df = self.df_usd[self.df_usd['is_fraud'] == False]
+        # Суммы и средние по мошенническим и легальным транзакциям за один проход;
+        # для отсутствующей группы сумма равна 0, а среднее - NaN, как по пустой выборке
+        amount_by_fraud = self.df_usd.groupby('is_fraud')['amount_usd'].agg(['sum', 'mean']).reindex([False, True])
+        amount_by_fraud['sum'] = amount_by_fraud['sum'].fillna(0.0)
+        fraud_amount = amount_by_fraud.loc[True]
+        legit_amount = amount_by_fraud.loc[False]
 
         # Общие финансовые потери от мошенничества
-        total_fraud_loss = fraud_df['amount_usd'].sum()
-        total_transaction_volume = self.df_usd['amount_usd'].sum()
-
-        metrics['financial'] = {
-            'total_fraud_loss_usd': round(total_fraud_loss, 2),
-            'total_transaction_volume_usd': round(total_transaction_volume, 2),
-            'fraud_loss_percentage': round((total_fraud_loss / total_transaction_volume) * 100, 2),
-            'average_fraud_amount_usd': round(fraud_df['amount_usd'].mean(), 2),
-            'average_legit_amount_usd': round(legit_df['amount_usd'].mean(), 2),
-            'fraud_amount_multiplier': round(fraud_df['amount_usd'].mean() / legit_df['amount_usd'].mean(), 2)
-        }
+        total_fraud_loss = fraud_amount['sum']
+        total_transaction_volume = amount_usd.sum()
+
+        financial = _rounded(
+            FinancialMetrics, 2,
+            total_fraud_loss_usd=total_fraud_loss,
+            total_transaction_volume_usd=total_transaction_volume,
+            fraud_loss_percentage=(total_fraud_loss / total_transaction_volume) * 100,
+            average_fraud_amount_usd=fraud_amount['mean'],
+            average_legit_amount_usd=legit_amount['mean'],
+            fraud_amount_multiplier=fraud_amount['mean'] / legit_amount['mean']
+        )
 
         # 2. ОПЕРАЦИОННЫЕ МЕТРИКИ
-        total_transactions = len(self.df_usd)
-        fraud_transactions = len(fraud_df)
-
-        metrics['operational'] = {
-            'total_transactions': total_transactions,
-            'fraud_transactions': fraud_transactions,
-            'fraud_rate_percentage': round((fraud_transactions / total_transactions) * 100, 2),
-            'transactions_per_day': round(total_transactions / 31, 0),  # 31 день в датасете
-            'fraud_transactions_per_day': round(fraud_transactions / 31, 0),
-            'unique_customers': self.df_usd['customer_id'].nunique(),
-            'avg_transactions_per_customer': round(total_transactions / self.df_usd['customer_id'].nunique(), 1)
-        }
+        total_transactions = len(is_fraud)
+        unique_customers = self.df_usd['customer_id'].nunique()
+        fraud_transactions = np.count_nonzero(is_fraud)
+
+        operational = OperationalMetrics(
+            total_transactions=total_transactions,
+            fraud_transactions=fraud_transactions,
+            fraud_rate_percentage=round((fraud_transactions / total_transactions) * 100, 2),
+            transactions_per_day=round(total_transactions / 31, 0),  # 31 день в датасете
+            fraud_transactions_per_day=round(fraud_transactions / 31, 0),
+            unique_customers=unique_customers,
+            avg_transactions_per_customer=round(total_transactions / unique_customers, 1)
+        )
 
         # 3. ГЕОГРАФИЧЕСКИЕ РИСКИ
-        country_fraud_stats = self.df_usd.groupby('country').agg({
-            'is_fraud': ['count', 'sum', 'mean'],
-            'amount_usd': 'sum'
-        }).round(3)
-
-        country_fraud_stats.columns = ['total_transactions', 'fraud_transactions', 'fraud_rate', 'total_volume_usd']
-        country_fraud_stats = country_fraud_stats.sort_values('fraud_transactions', ascending=False)
+        country_fraud_stats = self.country_fraud_stats.round(3).sort_values('fraud_transactions', ascending=False)
 
         # Топ-5 самых рискованных стран
         top_risk_countries = country_fraud_stats.head(5).to_dict('index')
 
-        metrics['geographic_risk'] = {
-            'top_risk_countries': top_risk_countries,
-            'countries_with_fraud': len(country_fraud_stats[country_fraud_stats['fraud_transactions'] > 0]),
-            'high_risk_countries_count': len(country_fraud_stats[country_fraud_stats['fraud_rate'] > 0.3])
-        }
+        geographic_risk = GeographicRiskMetrics(
+            top_risk_countries=top_risk_countries,
+            countries_with_fraud=len(country_fraud_stats[country_fraud_stats['fraud_transactions'] > 0]),
+            high_risk_countries_count=len(country_fraud_stats[country_fraud_stats['fraud_rate'] > 0.3])
+        )
 
         # 4. ВРЕМЕННЫЕ ПАТТЕРНЫ
-        hourly_fraud = self.df_usd.groupby('hour')['is_fraud'].agg(['count', 'sum', 'mean'])
+        hourly_fraud = self.hourly_fraud_stats
         peak_fraud_hour = hourly_fraud['mean'].idxmax()
 
-        night_fraud_rate = self.df_usd[self.df_usd['is_night']]['is_fraud'].mean()
-        day_fraud_rate = self.df_usd[~self.df_usd['is_night']]['is_fraud'].mean()
+        # Доли мошенничества внутри маски и вне ее считаются по однобайтовым
+        # массивам, без копирования строк таблицы
+        night_fraud_rate, day_fraud_rate = _masked_rates(is_fraud, is_night)
 
-        metrics['temporal_patterns'] = {
-            'peak_fraud_hour': int(peak_fraud_hour),
-            'peak_fraud_rate': round(hourly_fraud.loc[peak_fraud_hour, 'mean'], 3),
-            'night_fraud_rate': round(night_fraud_rate, 3),
-            'day_fraud_rate': round(day_fraud_rate, 3),
-            'night_vs_day_risk_ratio': round(night_fraud_rate / day_fraud_rate, 2)
-        }
+        temporal_patterns = TemporalPatternMetrics(
+            peak_fraud_hour=peak_fraud_hour,
+            peak_fraud_rate=round(hourly_fraud.loc[peak_fraud_hour, 'mean'], 3),
+            night_fraud_rate=round(night_fraud_rate, 3),
+            day_fraud_rate=round(day_fraud_rate, 3),
+            night_vs_day_risk_ratio=round(night_fraud_rate / day_fraud_rate, 2)
+        )
 
         # 5. ПОВЕДЕНЧЕСКИЕ МЕТРИКИ
         # Анализ активности клиентов
-        def extract_unique_merchants(activity):
-            if activity and 'unique_merchants' in activity:
-                return activity['unique_merchants']
-            return None
-
-        self.df_usd['unique_merchants'] = self.df_usd['last_hour_activity'].apply(extract_unique_merchants)
-        customer_medians = self.df_usd.groupby('customer_id')['unique_merchants'].median()
-
-        quantile_95 = customer_medians.quantile(0.95)
-        high_activity_customers = (customer_medians > quantile_95).sum()
+        # Поле unique_merchants берется из Arrow struct как дочерний массив;
+        # flatten() учитывает пропуски родительской структуры. Полностью пустая
+        # колонка определяется Arrow как null, а не struct - тогда значений нет
+        activity = pa.array(self.df_usd['last_hour_activity'], from_pandas=True)
+        merchants_index = (activity.type.get_field_index('unique_merchants')
+                           if pa.types.is_struct(activity.type) else -1)
+        self.df_usd['unique_merchants'] = (
+            activity.flatten()[merchants_index].to_numpy(zero_copy_only=False)
+            if merchants_index >= 0 else np.nan
+        )
+        customer_medians = self.df_usd.groupby('customer_id', observed=True, sort=False)['unique_merchants'].median()
+
+        # 95-й перцентиль считается по значениям без пропусков: np.nanquantile выбирает
+        # нужные порядковые статистики через np.partition, без полной сортировки.
+        # Если значений нет совсем, порог (как и в pandas) равен NaN
+        medians = customer_medians.to_numpy()
+        quantile_95 = np.nanquantile(medians, 0.95) if not np.isnan(medians).all() else np.nan
+        high_activity = medians > quantile_95
+        high_activity_customers = np.count_nonzero(high_activity)
 
         # Анализ мошенничества среди высокоактивных клиентов
-        high_activity_customer_ids = customer_medians[customer_medians > quantile_95].index
-        high_activity_fraud_rate = self.df_usd[
-            self.df_usd['customer_id'].isin(high_activity_customer_ids)
-        ]['is_fraud'].mean()
-
-        metrics['behavioral'] = {
-            'high_activity_customers_count': int(high_activity_customers),
-            'high_activity_customers_percentage': round((high_activity_customers / len(customer_medians)) * 100, 2),
-            'high_activity_fraud_rate': round(high_activity_fraud_rate, 3),
-            'median_unique_merchants_95th_percentile': round(quantile_95, 1),
-            'avg_customer_unique_merchants': round(customer_medians.mean(), 1)
-        }
+        # Принадлежность к высокоактивным клиентам проверяется по таблице,
+        # индексируемой кодом категории customer_id (последняя ячейка - для кода -1)
+        high_activity_customer_ids = customer_medians.index[high_activity]
+        customer_id = self.df_usd['customer_id'].cat
+        high_activity_lut = np.zeros(len(customer_id.categories) + 1, dtype=bool)
+        high_activity_lut[customer_id.categories.get_indexer(high_activity_customer_ids)] = True
+        high_activity_mask = high_activity_lut[customer_id.codes.to_numpy()]
+        high_activity_fraud_rate = is_fraud[high_activity_mask].mean()
+
+        behavioral = BehavioralMetrics(
+            high_activity_customers_count=high_activity_customers,
+            high_activity_customers_percentage=round((high_activity_customers / len(customer_medians)) * 100, 2),
+            high_activity_fraud_rate=round(high_activity_fraud_rate, 3),
+            median_unique_merchants_95th_percentile=round(quantile_95, 1),
+            avg_customer_unique_merchants=round(customer_medians.mean(), 1)
+        )
 
         # 6. КАТЕГОРИИ ПРОДАВЦОВ
-        vendor_analysis = self.df_usd.groupby('vendor_category').agg({
-            'is_fraud': ['count', 'sum', 'mean'],
-            'amount_usd': ['sum', 'mean']
-        }).round(3)
-
-        vendor_analysis.columns = ['total_transactions', 'fraud_transactions', 'fraud_rate', 'total_volume_usd', 'avg_amount_usd']
-        vendor_analysis = vendor_analysis.sort_values('fraud_rate', ascending=False)
+        vendor_analysis = self.vendor_fraud_stats.round(3).sort_values('fraud_rate', ascending=False)
 
         # Высокорисковые продавцы
-        high_risk_vendor_fraud_rate = self.df_usd[self.df_usd['is_high_risk_vendor']]['is_fraud'].mean()
-        low_risk_vendor_fraud_rate = self.df_usd[~self.df_usd['is_high_risk_vendor']]['is_fraud'].mean()
-
-        metrics['vendor_risk'] = {
-            'high_risk_vendor_fraud_rate': round(high_risk_vendor_fraud_rate, 3),
-            'low_risk_vendor_fraud_rate': round(low_risk_vendor_fraud_rate, 3),
-            'risk_vendor_multiplier': round(high_risk_vendor_fraud_rate / low_risk_vendor_fraud_rate, 2),
-            'riskiest_vendor_category': vendor_analysis.index[0],
-            'riskiest_category_fraud_rate': round(vendor_analysis.iloc[0]['fraud_rate'], 3)
-        }
+        high_risk_vendor_fraud_rate, low_risk_vendor_fraud_rate = _masked_rates(is_fraud, is_high_risk_vendor)
+
+        vendor_risk = VendorRiskMetrics(
+            high_risk_vendor_fraud_rate=round(high_risk_vendor_fraud_rate, 3),
+            low_risk_vendor_fraud_rate=round(low_risk_vendor_fraud_rate, 3),
+            risk_vendor_multiplier=round(high_risk_vendor_fraud_rate / low_risk_vendor_fraud_rate, 2),
+            riskiest_vendor_category=vendor_analysis.index[0],
+            riskiest_category_fraud_rate=round(vendor_analysis.iloc[0]['fraud_rate'], 3)
+        )
 
         # 7. КАНАЛЫ И УСТРОЙСТВА
-        device_fraud = self.df_usd.groupby('device')['is_fraud'].agg(['count', 'mean']).sort_values('mean', ascending=False)
-        channel_fraud = self.df_usd.groupby('channel')['is_fraud'].agg(['count', 'mean']).sort_values('mean', ascending=False)
-
-        metrics['device_channel'] = {
-            'riskiest_device': device_fraud.index[0],
-            'riskiest_device_fraud_rate': round(device_fraud.iloc[0]['mean'], 3),
-            'riskiest_channel': channel_fraud.index[0],
-            'riskiest_channel_fraud_rate': round(channel_fraud.iloc[0]['mean'], 3),
-            'card_present_fraud_rate': round(self.df_usd[self.df_usd['is_card_present']]['is_fraud'].mean(), 3),
-            'card_not_present_fraud_rate': round(self.df_usd[~self.df_usd['is_card_present']]['is_fraud'].mean(), 3)
-        }
+        device = self.df_usd['device'].cat
+        channel = self.df_usd['channel'].cat
+        device_fraud = _fraud_stats_by_code(device.codes.to_numpy(), is_fraud, device.categories).sort_values('mean', ascending=False)
+        channel_fraud = _fraud_stats_by_code(channel.codes.to_numpy(), is_fraud, channel.categories).sort_values('mean', ascending=False)
+        card_present_fraud_rate, card_not_present_fraud_rate = _masked_rates(is_fraud, is_card_present)
+
+        device_channel = DeviceChannelMetrics(
+            riskiest_device=device_fraud.index[0],
+            riskiest_device_fraud_rate=round(device_fraud.iloc[0]['mean'], 3),
+            riskiest_channel=channel_fraud.index[0],
+            riskiest_channel_fraud_rate=round(channel_fraud.iloc[0]['mean'], 3),
+            card_present_fraud_rate=round(card_present_fraud_rate, 3),
+            card_not_present_fraud_rate=round(card_not_present_fraud_rate, 3)
+        )
 
         # 8. ПОТЕНЦИАЛЬНАЯ ЭКОНОМИЯ
         # Если бы мы могли предотвратить 50% мошенничества
         potential_savings_50 = total_fraud_loss * 0.5
         potential_savings_80 = total_fraud_loss * 0.8
 
-        metrics['potential_impact'] = {
-            'potential_savings_50_percent_usd': round(potential_savings_50, 2),
-            'potential_savings_80_percent_usd': round(potential_savings_80, 2),
-            'monthly_fraud_loss_usd': round(total_fraud_loss / 31 * 30, 2),  # Месячные потери
-            'annual_fraud_loss_projection_usd': round(total_fraud_loss / 31 * 365, 2)  # Годовые потери
-        }
-
-        return metrics
+        potential_impact = _rounded(
+            PotentialImpactMetrics, 2,
+            potential_savings_50_percent_usd=potential_savings_50,
+            potential_savings_80_percent_usd=potential_savings_80,
+            monthly_fraud_loss_usd=total_fraud_loss / 31 * 30,  # Месячные потери
+            annual_fraud_loss_projection_usd=total_fraud_loss / 31 * 365  # Годовые потери
+        )
+
+        return FraudMetrics(
+            financial=financial,
+            operational=operational,
+            geographic_risk=geographic_risk,
+            temporal_patterns=temporal_patterns,
+            behavioral=behavioral,
+            vendor_risk=vendor_risk,
+            device_channel=device_channel,
+            potential_impact=potential_impact
+        )
 
     def generate_risk_scores(self):
         """
@@ -208,21 +427,21 @@ class FraudAnalyzer:
         risk_scores = {}
 
         # Риск-скоры по странам (нормализованные от 0 до 100)
-        country_fraud_rates = self.df_usd.groupby('country')['is_fraud'].mean()
+        country_fraud_rates = self.country_fraud_stats['fraud_rate']
         max_fraud_rate = country_fraud_rates.max()
         country_risk_scores = (country_fraud_rates / max_fraud_rate * 100).round(1)
 
         risk_scores['country_risk_scores'] = country_risk_scores.to_dict()
 
         # Риск-скоры по времени
-        hourly_fraud_rates = self.df_usd.groupby('hour')['is_fraud'].mean()
+        hourly_fraud_rates = self.hourly_fraud_stats['mean']
         max_hourly_fraud = hourly_fraud_rates.max()
         hourly_risk_scores = (hourly_fraud_rates / max_hourly_fraud * 100).round(1)
 
         risk_scores['hourly_risk_scores'] = hourly_risk_scores.to_dict()
 
         # Риск-скоры по категориям продавцов
-        vendor_fraud_rates = self.df_usd.groupby('vendor_category')['is_fraud'].mean()
+        vendor_fraud_rates = self.vendor_fraud_stats['fraud_rate']
         max_vendor_fraud = vendor_fraud_rates.max()
         vendor_risk_scores = (vendor_fraud_rates / max_vendor_fraud * 100).round(1)
 
@@ -234,75 +453,38 @@ class FraudAnalyzer:
         """
         Сохранение результатов анализа
         """
-        import os
-        os.makedirs(output_dir, exist_ok=True)
-
         # Расчет метрик
         metrics = self.calculate_key_business_metrics()
         risk_scores = self.generate_risk_scores()
 
-        # Сохранение в JSON
-        with open(f'{output_dir}/business_metrics.json', 'w', encoding='utf-8') as f:
-            json.dump(metrics, f, indent=2, ensure_ascii=False)
-
-        with open(f'{output_dir}/risk_scores.json', 'w', encoding='utf-8') as f:
-            json.dump(risk_scores, f, indent=2, ensure_ascii=False)
-
-        # Создание краткого отчета
-        report = self._generate_executive_summary(metrics)
-        with open(f'{output_dir}/executive_summary.md', 'w', encoding='utf-8') as f:
-            f.write(report)
-
+        self.write_results(metrics, risk_scores, output_dir)
         return metrics, risk_scores
 
-    def _generate_executive_summary(self, metrics):
+    @classmethod
+    def write_results(cls, metrics, risk_scores, output_dir='results'):
         """
-        Генерация краткого отчета для руководства
+        Запись готовых результатов анализа в файлы (в том числе взятых из кэша)
         """
-        report = f"""# Executive Summary: Fraud Analysis Report
-
-## 🚨 Критические показатели
-
-**Общие потери от мошенничества:** ${metrics['financial']['total_fraud_loss_usd']:,.2f}
-**Доля мошеннических операций:** {metrics['operational']['fraud_rate_percentage']}%
-**Средний ущерб от одной мошеннической операции:** ${metrics['financial']['average_fraud_amount_usd']:,.2f}
-
-## 📊 Ключевые метрики
-
-### Финансовое влияние
-- Мошеннические операции составляют {metrics['financial']['fraud_loss_percentage']}% от общего оборота
-- Средняя мошенническая операция в {metrics['financial']['fraud_amount_multiplier']}x раз больше легитимной
-- Прогнозируемые годовые потери: ${metrics['potential_impact']['annual_fraud_loss_projection_usd']:,.2f}
-
-### Операционные показатели
-- Обрабатывается {metrics['operational']['transactions_per_day']:,.0f} транзакций в день
-- Из них {metrics['operational']['fraud_transactions_per_day']:,.0f} мошеннических
-- {metrics['operational']['unique_customers']:,} активных клиентов
-
-### Географические риски
-- {metrics['geographic_risk']['countries_with_fraud']} стран с зафиксированным мошенничеством
-- {metrics['geographic_risk']['high_risk_countries_count']} стран с критически высоким уровнем риска (>30%)
-
-### Поведенческие аномалии
-- {metrics['behavioral']['high_activity_customers_count']} клиентов ({metrics['behavioral']['high_activity_customers_percentage']}%) демонстрируют подозрительную активность
-- Уровень мошенничества среди высокоактивных клиентов: {metrics['behavioral']['high_activity_fraud_rate']:.1%}
-
-## 💰 Потенциальная экономия
-
-При улучшении системы детекции на 50%: **${metrics['potential_impact']['potential_savings_50_percent_usd']:,.2f}**
-При улучшении системы детекции на 80%: **${metrics['potential_impact']['potential_savings_80_percent_usd']:,.2f}**
-
-## 🎯 Приоритетные направления
+        os.makedirs(output_dir, exist_ok=True)
 
-1. **Географическая сегментация** - фокус на топ-5 рискованных стран
-2. **Поведенческий анализ** - мониторинг высокоактивных клиентов
-3. **Временные паттерны** - усиленный контроль в пиковые часы мошенничества
-4. **Категории продавцов** - дополнительные проверки для рискованных категорий
+        # Все файлы сериализуются заранее и записываются на диск параллельно
+        outputs = {
+            f'{output_dir}/business_metrics.json': orjson.dumps(metrics, option=JSON_OPTIONS),
+            f'{output_dir}/risk_scores.json': orjson.dumps(risk_scores, option=JSON_OPTIONS),
+            # Краткий отчет для руководства
+            f'{output_dir}/executive_summary.md': cls._generate_executive_summary(metrics).encode('utf-8')
+        }
+        write_files(outputs)
 
----
-*Отчет сгенерирован: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}*
-"""
-        return report
+    @staticmethod
+    def _generate_executive_summary(metrics):
+        """
+        Генерация краткого отчета для руководства
+        """
+        return _summary_template().render(
+            metrics=metrics,
+            generated_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        )
 
 if __name__ == "__main__":
     # Пример использования
@@ -0,0 +1,71 @@
+"""
+Модуль для кэширования результатов анализа между запусками
+"""
+
+import hashlib
+import os
+import pickle
+from typing import Any, Iterable, Optional
+
+# Версия формата кэша; увеличивается при несовместимых изменениях результатов
+CACHE_VERSION = 1
+
+# Модули, от кода которых зависят результаты анализа
+SOURCE_MODULES = ('data_loader.py', 'fraud_analyzer.py', 'business_insights_analyzer.py', 'results_io.py')
+
+def cache_key(name: str, paths: Iterable[str]) -> str:
+    """
+    Ключ кэша по mtime и размеру входных файлов и модулей анализа
+
+    Args:
+        name: имя набора результатов (например, 'fraud')
+        paths: пути к входным файлам данных
+
+    Returns:
+        Ключ кэша вида '<name>-<хеш>'
+    """
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    parts = [name, str(CACHE_VERSION)]
+    for path in (*paths, *(os.path.join(src_dir, m) for m in SOURCE_MODULES)):
+        st = os.stat(path)
+        parts.append(f"{st.st_mtime_ns}:{st.st_size}")
+    digest = hashlib.blake2b(':'.join(parts).encode('utf-8'), digest_size=16).hexdigest()
+    return f"{name}-{digest}"
+
+def load(key: str, cache_dir: str = 'results/.cache') -> Optional[Any]:
+    """
+    Загрузка сохраненных результатов
+
+    Returns:
+        Результаты или None, если кэш для ключа отсутствует
+    """
+    try:
+        with open(os.path.join(cache_dir, f"{key}.pickle"), 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+
+def save(key: str, results: Any, cache_dir: str = 'results/.cache') -> None:
+    """
+    Сохранение результатов под ключом кэша
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, f"{key}.pickle")
+
+    # Для каждого набора результатов хранится только последняя версия
+    prefix = key.rpartition('-')[0] + '-'
+    for entry in os.listdir(cache_dir):
+        if entry.startswith(prefix) and not entry.startswith(key):
+            try:
+                os.unlink(os.path.join(cache_dir, entry))
+            except FileNotFoundError:
+                pass
+
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
\ No newline at end of file
@@ -0,0 +1,31 @@
+"""
+Модуль для записи результатов анализа в файлы
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+import orjson
+
+# Параметры сериализации результатов в JSON: numpy-скаляры (int64/float64)
+# сериализуются orjson напрямую, без приведения к типам Python
+JSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+def write_bytes(path: str, payload: bytes) -> None:
+    """Запись готовых байтов в файл"""
+    # Данные уже закодированы, поэтому пишутся через небуферизованный файл
+    # напрямую из исходного буфера, без промежуточного копирования
+    with open(path, 'wb', buffering=0) as f:
+        view = memoryview(payload)
+        while view:
+            view = view[f.write(view):]
+
+def write_files(outputs: Dict[str, bytes]) -> None:
+    """
+    Параллельная запись заранее сериализованных файлов
+
+    Args:
+        outputs: словарь путь -> содержимое файла в байтах
+    """
+    with ThreadPoolExecutor(max_workers=len(outputs)) as pool:
+        list(pool.map(write_bytes, outputs.keys(), outputs.values()))
\ No newline at end of file
@@ -0,0 +1,49 @@
+"""
+Общие вспомогательные функции для скриптов запуска анализа
+"""
+
+import gc
+import os
+import sys
+from contextlib import contextmanager
+
+# Переменная окружения с числом ядер, к которым привязывается процесс;
+# если она не задана, привязка не выполняется
+CPUS_ENV_VAR = 'ANALYSIS_CPUS'
+
+def stat_or_die(path):
+    """Один вызов stat на файл; при его отсутствии - завершение с ошибкой"""
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        print(f"❌ Файл {path} не найден!")
+        sys.exit(1)
+
+@contextmanager
+def gc_paused():
+    """Отключение сборщика мусора на время агрегаций pandas"""
+    gc.disable()
+    try:
+        yield
+    finally:
+        gc.collect()
+        gc.enable()
+
+def pin_cpus():
+    """
+    Привязка процесса (и его дочерних процессов) к первым доступным ядрам
+
+    Число ядер задается переменной окружения ANALYSIS_CPUS; без нее (или
+    при нуле) процесс использует все ядра, разрешенные ему системой
+    """
+    count = int(os.environ.get(CPUS_ENV_VAR) or 0)
+    if count > 0 and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, sorted(os.sched_getaffinity(0))[:count])
+
+def excepthook(exc_type, exc, tb):
+    """Вывод необработанной ошибки анализа вместо обертки main() в try/except"""
+    # Прерывание пользователем и выход из интерпретатора ошибками анализа не являются
+    if not issubclass(exc_type, (KeyboardInterrupt, SystemExit)):
+        print(f"❌ Ошибка при выполнении анализа: {exc}")
+        sys.stdout.flush()
+    sys.__excepthook__(exc_type, exc, tb)
@@ -0,0 +1,68 @@
+"""
+Тесты загрузки и предобработки данных
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from data_loader import DataLoader
+
+
+class PreprocessPrunedLoadTest(unittest.TestCase):
+    """Предобработка после загрузки только части колонок"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.transaction_path = os.path.join(self.tmp_dir.name, 'transactions.parquet')
+        self.exchange_path = os.path.join(self.tmp_dir.name, 'exchange.parquet')
+
+        pd.DataFrame({
+            'timestamp': pd.to_datetime(['2024-10-01 23:15', '2024-10-02 12:00', '2024-10-05 03:30']),
+            'amount': [100.0, 250.0, 40.0],
+            'currency': ['USD', 'EUR', 'USD'],
+            'last_hour_activity': [
+                {'num_transactions': 1, 'total_amount': 100.0, 'unique_merchants': 1},
+                {'num_transactions': 3, 'total_amount': 900.0, 'unique_merchants': 2},
+                None,
+            ],
+        }).to_parquet(self.transaction_path)
+        pd.DataFrame({
+            'date': ['2024-10-01', '2024-10-02', '2024-10-05'],
+            'USD': [1.0, 1.0, 1.0],
+            'EUR': [0.9, 0.9, 0.9],
+        }).to_parquet(self.exchange_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_preprocess_without_activity_column(self):
+        loader = DataLoader(self.transaction_path, self.exchange_path)
+        loader.load_data(columns=['timestamp', 'amount', 'currency'])
+
+        df = loader.preprocess_data()
+
+        self.assertNotIn('last_hour_activity', df.columns)
+        self.assertNotIn('num_transactions_last_hour', df.columns)
+        self.assertEqual(df['hour'].tolist(), [23, 12, 3])
+        self.assertEqual(df['is_night'].tolist(), [True, False, True])
+        self.assertEqual(df['is_weekend'].tolist(), [False, False, True])
+
+    def test_preprocess_with_activity_column(self):
+        loader = DataLoader(self.transaction_path, self.exchange_path)
+        loader.load_data()
+
+        df = loader.preprocess_data()
+
+        self.assertEqual(df['num_transactions_last_hour'].tolist()[:2], [1, 3])
+        self.assertTrue(pd.isna(df['num_transactions_last_hour'].iloc[2]))
+        self.assertEqual(df['total_amount_last_hour'].tolist()[:2], [100.0, 900.0])
+
+
+if __name__ == '__main__':
+    unittest.main()